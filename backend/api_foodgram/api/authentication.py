@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from recipes.versions import AUTH_TOKENS, bump_version, get_version
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .metrics import registry
+
+User = get_user_model()
+
+# Счётчики и флаг лент меняются запросами UPDATE без сигналов, поэтому
+# в снимок не попадают и при обращении читаются из базы.
+UNCACHED_FIELDS = ('recipes_count', 'followers_count', 'feed_fanout')
+
+
+class CachedToken(NamedTuple):
+    expires: float
+    version: int
+    field_names: Tuple[str, ...]
+    values: tuple
+    created: object
+
+
+class TokenCache:
+    """Проверенные токены в памяти процесса.
+
+    Хранит не объекты, а снимок полей пользователя, из которого для
+    каждого запроса собирается новый экземпляр. Размер ограничен
+    ``size`` записями, давно не использованные вытесняются первыми;
+    запись живёт не дольше ``ttl`` секунд и вместе с версией токена
+    из общего кэша, прочитанной до запроса к базе. Запись с другой
+    версией считается промахом.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Возвращает (пользователь, токен) или None при промахе.
+        ``version`` — текущая версия токена из общего кэша.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.expires < now
+                                      or entry.version != version):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        user = User.from_db(DEFAULT_DB_ALIAS, entry.field_names, entry.values)
+        token = Token(key=key, user=user, created=entry.created)
+        return user, token
+
+    def set(self, user, token, version):
+        """Запоминает токен, прочитанный из базы при версии
+        ``version``. Если версия с тех пор увеличилась, данные могли
+        устареть, и следующее обращение их не примет.
+        """
+        fields = [field for field in User._meta.concrete_fields
+                  if field.attname not in UNCACHED_FIELDS]
+        entry = CachedToken(
+            expires=time.monotonic() + self.ttl,
+            version=version,
+            field_names=tuple(field.attname for field in fields),
+            values=tuple(getattr(user, field.attname) for field in fields),
+            created=token.created,
+        )
+        with self._lock:
+            self._entries[token.key] = entry
+            self._entries.move_to_end(token.key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Счётчики для страницы метрик: (имя, тип, описание, значение)."""
+        return (
+            ('foodgram_token_cache_hits_total', 'counter',
+             'Token lookups served from the process cache.', self.hits),
+            ('foodgram_token_cache_misses_total', 'counter',
+             'Token lookups that went to the database.', self.misses),
+            ('foodgram_token_cache_entries', 'gauge',
+             'Tokens currently held in the process cache.',
+             len(self._entries)),
+        )
+
+
+token_cache = TokenCache(
+    size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60))
+registry.add_counters(token_cache.metrics)
+
+
+def _version_name(key):
+    return f'{AUTH_TOKENS}:{key}'
+
+
+def token_version(key):
+    """Версия токена в общем кэше. Ключ версии живёт дольше записей
+    TokenCache, а истёкший или вытесненный ключ получает новое
+    значение, с которым сохранённые записи просто не совпадут.
+    """
+    return get_version(_version_name(key), timeout=2 * token_cache.ttl)
+
+
+def invalidate_token(key):
+    """Отзывает токен из кэшей всех процессов."""
+    bump_version(_version_name(key), timeout=2 * token_cache.ttl)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса Token JOIN User для токенов,
+    уже проверенных этим процессом. Вместо него каждый запрос читает
+    версию токена из общего кэша. Неизвестные, удалённые токены и
+    неактивные пользователи проверяются базой, как и раньше: в кэш
+    попадают только токены активных пользователей.
+
+    Удаление токена и сохранение пользователя увеличивают версию
+    токена, и запись перестаёт действовать во всех процессах сразу
+    (при REFERENCE_CACHE в памяти процесса — только в этом процессе,
+    поэтому api.E001 требует общий кэш для нескольких воркеров).
+    Изменения через QuerySet.update() сигналов не отправляют и
+    вступают в силу не позже чем через AUTH_TOKEN_CACHE_TTL секунд.
+    """
+
+    def authenticate_credentials(self, key):
+        version = token_version(key)
+        cached = token_cache.get(key, version)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(user, token, version)
+        return user, token
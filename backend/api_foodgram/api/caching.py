@@ -0,0 +1,70 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from recipes.versions import get_version
+from rest_framework import status
+
+
+class CachedReferenceMixin:
+    """Кэширует ответы на чтение справочных данных (теги, ингредиенты).
+
+    Ключ кэша включает версию справочника, которую сигналы моделей
+    увеличивают при каждом изменении. Версия видна всем процессам,
+    только если REFERENCE_CACHE общий; кэш в памяти процесса не
+    узнаёт об изменениях из других процессов, и его записи живут не
+    дольше REFERENCE_CACHE_MAX_AGE. Ответ снабжается строгим ETag;
+    запрос с совпадающим If-None-Match получает 304 без обращения
+    к базе.
+    Данные публичные, поэтому аутентификация выполняется лениво:
+    токен не проверяется, пока к request.user никто не обратился.
+    """
+    reference_name = None
+
+    def perform_authentication(self, request):
+        pass
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = caches[settings.REFERENCE_CACHE]
+        key = 'reference:{}:{}:{}:{}'.format(
+            self.reference_name,
+            get_version(self.reference_name),
+            request.accepted_renderer.format,
+            hashlib.md5(request.get_full_path().encode()).hexdigest())
+        entry = cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            response = self.finalize_response(
+                request, response, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            etag = '"{}"'.format(
+                hashlib.sha1(response.content).hexdigest())
+            entry = (etag, response['Content-Type'], response.content)
+            cache.set(key, entry, settings.REFERENCE_CACHE_TIMEOUT)
+
+        etag, content_type, content = entry
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags or etags == ['*']:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True,
+            max_age=settings.REFERENCE_CACHE_MAX_AGE)
+        patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    """Через REFERENCE_CACHE (версии справочников) и кэш по умолчанию
+    (снимки связей пользователей) процессы сообщают друг другу об
+    изменениях, поэтому эти кэши должны быть общими: при кэше в памяти
+    процесса изменение, сделанное одним воркером, другие не увидят.
+    """
+    if settings.WEB_CONCURRENCY <= 1:
+        return []
+    errors = []
+    for alias in sorted({settings.REFERENCE_CACHE, 'default'}):
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend not in settings.PROCESS_LOCAL_CACHES:
+            continue
+        errors.append(Error(
+            f'Cache "{alias}" uses {backend}, which is not shared '
+            f'between {settings.WEB_CONCURRENCY} worker processes.',
+            hint='Set CACHE_BACKEND to a shared cache such as memcached '
+                 'or run a single worker.',
+            id='api.E001',
+        ))
+    return errors
+
+
+@register()
+def metrics_dir_check(app_configs, **kwargs):
+    """Каждый воркер накапливает замеры запросов в своей памяти, и без
+    общего каталога METRICS_DIR страница метрик показывала бы только
+    замеры обработавшего её процесса.
+    """
+    if settings.WEB_CONCURRENCY <= 1 or settings.METRICS_DIR:
+        return []
+    return [Error(
+        f'Request metrics are collected per process, but '
+        f'{settings.WEB_CONCURRENCY} worker processes are configured '
+        f'and METRICS_DIR is not set.',
+        hint='Set METRICS_DIR to a directory shared by the workers '
+             'or run a single worker.',
+        id='api.E002',
+    )]
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import time
+
+from django.conf import settings
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+CHUNK_SIZE = 64 * 1024
+
+
+class ExportTimeout(Exception):
+    """Рендер PDF не уложился в SHOPPING_CART_PDF_TIMEOUT."""
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def export_txt(rows):
+    for name, unit, total in rows:
+        yield f'{name} ({unit}) - {total}\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, total in rows:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': total},
+            ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+def _render_pdf(rows, deadline):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    for name, unit, total in rows:
+        if y < margin:
+            if time.monotonic() > deadline:
+                raise ExportTimeout
+            pdf.showPage()
+            y = height - margin
+        pdf.setFont(PDF_FONT_NAME, 12)
+        pdf.drawString(margin, y, f'{name} ({unit}) - {total}')
+        y -= line_height
+    pdf.save()
+    return buffer.getvalue()
+
+
+def export_pdf(rows):
+    """Рендерит PDF целиком в потоке запроса: синхронный воркер
+    gunicorn занят на всё время рендера, и число одновременных рендеров
+    ограничено только числом воркеров. Рендер прерывается на границе
+    страницы, если не уложился в SHOPPING_CART_PDF_TIMEOUT, поэтому
+    один запрос не держит воркер дольше этого времени.
+    """
+    content = _render_pdf(
+        rows, time.monotonic() + settings.SHOPPING_CART_PDF_TIMEOUT)
+    return (content[start:start + CHUNK_SIZE]
+            for start in range(0, len(content), CHUNK_SIZE))
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'json': (export_json, 'application/json'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
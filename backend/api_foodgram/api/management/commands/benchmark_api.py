@@ -0,0 +1,183 @@
+import gc
+import json
+import os
+import statistics
+import time
+
+from api.metrics import SqlMeter, Stopwatch, measure_serialization
+from api.scenarios import SCENARIOS, clients, perform, seeded_database
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _measure(context, client, anonymous_client, samples):
+    for scenario in SCENARIOS:
+        meter, stopwatch = SqlMeter(), Stopwatch()
+        with connection.execute_wrapper(meter), \
+                measure_serialization(stopwatch):
+            start = time.perf_counter()
+            perform(scenario, context, client, anonymous_client)
+            elapsed = time.perf_counter() - start
+        samples[scenario.name].append(
+            (elapsed, meter.queries, meter.seconds, stopwatch.total))
+
+
+def run(context, repeat):
+    """Прогоняет все сценарии ``repeat`` раз после одного прогрева
+    и возвращает метрики по каждому маршруту.
+    """
+    client, anonymous_client = clients(context)
+    for scenario in SCENARIOS:
+        perform(scenario, context, client, anonymous_client)
+
+    samples = {scenario.name: [] for scenario in SCENARIOS}
+    for _ in range(repeat):
+        # Полная сборка мусора по засеянным данным занимает десятки
+        # миллисекунд и попадала бы в случайный замер, поэтому она
+        # выполняется между прогонами, а не во время них.
+        gc.collect()
+        gc.disable()
+        try:
+            _measure(context, client, anonymous_client, samples)
+        finally:
+            gc.enable()
+
+    report = {}
+    for name, rows in samples.items():
+        latency = [row[0] * 1000 for row in rows]
+        report[name] = {
+            'queries': max(row[1] for row in rows),
+            'sql_ms': round(statistics.median(
+                row[2] * 1000 for row in rows), 3),
+            'serialization_ms': round(statistics.median(
+                row[3] * 1000 for row in rows), 3),
+            'p50_ms': round(percentile(latency, 0.5), 3),
+            'p95_ms': round(percentile(latency, 0.95), 3),
+        }
+    return report
+
+
+def worst(reports):
+    """Объединяет отчёты нескольких прогонов, оставляя по каждой метрике
+    худшее значение: так бюджет учитывает разброс между прогонами.
+    """
+    merged = {}
+    for report in reports:
+        for name, row in report.items():
+            current = merged.setdefault(name, row)
+            for key, value in row.items():
+                current[key] = max(current[key], value)
+    return merged
+
+
+def compare(baseline, report, tolerance, slack_ms):
+    """Сверяет замеры с бюджетом: запросов не больше, чем в эталоне,
+    p95 не выше эталона с допуском ``tolerance`` и запасом ``slack_ms``.
+    Превышения по запросам и по времени возвращаются отдельно.
+    """
+    queries, latency = [], []
+    for name, current in report.items():
+        budget = baseline.get(name)
+        if budget is None:
+            queries.append(f'{name}: нет в эталоне')
+            continue
+        if current['queries'] > budget['queries']:
+            queries.append(
+                f'{name}: запросов {current["queries"]}, '
+                f'бюджет {budget["queries"]}')
+        limit = budget['p95_ms'] * (1 + tolerance) + slack_ms
+        if current['p95_ms'] > limit:
+            latency.append(
+                f'{name}: p95 {current["p95_ms"]:.1f} мс, '
+                f'бюджет {limit:.1f} мс')
+    return queries, latency
+
+
+class Command(BaseCommand):
+    help = ('benchmark every API endpoint on a seeded dataset and compare '
+            'query counts with the stored baseline; latency is reported '
+            'and enforced only with --check-latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', default=DEFAULT_BASELINE,
+            help='путь к JSON-файлу эталона')
+        parser.add_argument(
+            '--update', action='store_true',
+            help='записать текущие замеры как эталон')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='число прогонов, худший из которых записывается '
+                 'в эталон с --update')
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument(
+            '--tolerance', type=float, default=1.0,
+            help='допустимый относительный рост p95')
+        parser.add_argument(
+            '--slack-ms', type=float, default=5.0,
+            help='допустимый абсолютный рост p95, мс')
+        # Время на общих машинах шумит сильнее любого разумного допуска,
+        # поэтому по умолчанию оно только выводится.
+        parser.add_argument(
+            '--check-latency', action='store_true',
+            help='считать превышение p95 ошибкой')
+
+    def handle(self, *args, **options):
+        runs = options['runs'] if options['update'] else 1
+        with seeded_database(recipes=options['recipes'],
+                             users=options['users']) as context:
+            report = worst(run(context, options['repeat'])
+                           for _ in range(runs))
+
+        self.stdout.write(
+            f'{"маршрут":<24}{"запросы":>8}{"SQL, мс":>10}'
+            f'{"сериал., мс":>13}{"p50, мс":>10}{"p95, мс":>10}')
+        for name, row in report.items():
+            self.stdout.write(
+                f'{name:<24}{row["queries"]:>8}{row["sql_ms"]:>10.2f}'
+                f'{row["serialization_ms"]:>13.2f}'
+                f'{row["p50_ms"]:>10.2f}{row["p95_ms"]:>10.2f}')
+
+        path = options['baseline']
+        baselines = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                baselines = json.load(f)
+        if options['update']:
+            baselines[connection.vendor] = report
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(baselines, f, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f'Эталон записан: {path}')
+            return
+
+        if connection.vendor not in baselines:
+            # Замеры зависят от СУБД: время, а на PostgreSQL и число
+            # запросов из-за блокировок строк при записи.
+            raise CommandError(
+                f'Нет эталона для {connection.vendor}, '
+                f'запустите команду с --update')
+        queries, latency = compare(baselines[connection.vendor], report,
+                                   options['tolerance'], options['slack_ms'])
+        check_latency = options['check_latency']
+        problems = queries + latency if check_latency else queries
+        if problems:
+            raise CommandError(
+                'Превышен бюджет производительности:\n'
+                + '\n'.join(problems))
+        for problem in latency:
+            self.stdout.write(self.style.WARNING(problem))
+        budget = 'бюджет' if check_latency else 'бюджет запросов'
+        self.stdout.write(
+            f'Все {len(report)} маршрутов укладываются в {budget}')
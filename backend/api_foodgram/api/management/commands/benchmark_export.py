@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+
+from api.exporters import EXPORTERS
+from api.scenarios import clients, seeded_database
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe, ShoppingCart
+from recipes.shopping_list import rebuild
+
+
+def measure(client, export_format):
+    """Скачивает список покупок, читая потоковый ответ по частям.
+    Возвращает (код ответа, байт, пик памяти в КиБ, время в мс).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        response = client.get(
+            f'/api/recipes/download_shopping_cart/?format={export_format}')
+        size = sum(len(chunk) for chunk in response.streaming_content) \
+            if response.streaming else len(response.content)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    elapsed = (time.perf_counter() - start) * 1000
+    return response.status_code, size, peak / 1024, elapsed
+
+
+class Command(BaseCommand):
+    help = ('measure peak memory of the shopping list export in every '
+            'format for growing shopping carts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--carts', type=int, nargs='+', default=[100, 1000, 5000],
+            help='размеры корзины в рецептах')
+        parser.add_argument('--ingredients', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['carts'])
+        self.stdout.write(
+            f'{"рецептов":>9}{"формат":>8}{"код":>5}{"строк":>7}'
+            f'{"байт":>10}{"пик, КиБ":>10}{"мс":>9}')
+        with seeded_database(recipes=sizes[-1], users=30,
+                             ingredients=options['ingredients']) as context:
+            client, _ = clients(context)
+            user_id = context['user']
+            recipe_ids = list(
+                Recipe.objects.order_by('pk').values_list('pk', flat=True))
+            for size in sizes:
+                ShoppingCart.objects.bulk_create(
+                    [ShoppingCart(user_id=user_id, recipe_id=pk)
+                     for pk in recipe_ids[:size]],
+                    ignore_conflicts=True)
+                rows = rebuild([user_id])
+                for export_format in EXPORTERS:
+                    code, size_bytes, peak, elapsed = measure(
+                        client, export_format)
+                    self.stdout.write(
+                        f'{size:>9}{export_format:>8}{code:>5}{rows:>7}'
+                        f'{size_bytes:>10}{peak:>10.1f}{elapsed:>9.1f}')
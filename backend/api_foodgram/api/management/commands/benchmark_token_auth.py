@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from api.authentication import CachedTokenAuthentication, token_cache
+from api.metrics import SqlMeter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+BACKENDS = (
+    ('TokenAuthentication', TokenAuthentication),
+    ('CachedTokenAuthentication', CachedTokenAuthentication),
+)
+
+
+def measure(authentication, request, repeat):
+    """Аутентифицирует запрос ``repeat`` раз после одного прогрева.
+    Возвращает (медиана в мкс, p95 в мкс, SQL-запросов на запрос).
+    """
+    authentication.authenticate(request)
+    meter, timings = SqlMeter(), []
+    with connection.execute_wrapper(meter):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            authentication.authenticate(request)
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return (statistics.median(timings),
+            timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+            meter.queries / repeat)
+
+
+class Command(BaseCommand):
+    help = ('compare the per-request cost of token authentication '
+            'with and without the process token cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        results = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username='token-benchmark',
+                    email='token-benchmark@example.com')
+                token = Token.objects.create(user=user)
+                request = RequestFactory().get(
+                    '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token.key}')
+                for name, backend in BACKENDS:
+                    results[name] = measure(backend(), request, repeat)
+                transaction.set_rollback(True)
+        finally:
+            token_cache.clear()
+
+        self.stdout.write(
+            f'{"класс":<28}{"медиана, мкс":>14}{"p95, мкс":>10}'
+            f'{"запросов":>10}')
+        for name, (median, p95, queries) in results.items():
+            self.stdout.write(
+                f'{name:<28}{median:>14.1f}{p95:>10.1f}{queries:>10.2f}')
+        (plain, _, _), (cached, _, _) = results.values()
+        self.stdout.write(self.style.SUCCESS(
+            f'Экономия на запрос: {plain - cached:.1f} мкс '
+            f'({plain / max(cached, 1e-9):.1f}x)'))
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import re
+
+from api.scenarios import (PAGE_SIZE_SCENARIOS, PAGE_SIZES, SCENARIOS, clients,
+                           perform, seeded_database)
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'query_plans.json')
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?(?:e-?\d+)?\b')
+VALUE_LIST = re.compile(r'\((?:\?, )*\?\)')
+VALUE_ROWS = re.compile(r'\(\?\)(?:, \(\?\))+')
+SELECT_ROWS = re.compile(r'(SELECT (?:\?, )*\?)(?: UNION ALL \1)+')
+CASE_BRANCHES = re.compile(r'(WHEN \([^()]*\) THEN \? )\1+')
+POSTGRESQL_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def query_shape(sql):
+    """Приводит SQL к форме без литералов и с одним элементом
+    вместо списков значений, чтобы сравнивать запросы по структуре.
+    """
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = VALUE_LIST.sub('(?)', sql)
+    sql = VALUE_ROWS.sub('(?)', sql)
+    sql = SELECT_ROWS.sub(r'\1', sql)
+    return CASE_BRANCHES.sub(r'\1', sql)
+
+
+def fingerprint(shape):
+    return hashlib.md5(shape.encode()).hexdigest()[:12]
+
+
+def sequential_scans(sql):
+    """Возвращает таблицы, которые план запроса читает целиком."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.explain_query_prefix()} {sql}')
+        rows = cursor.fetchall()
+    if connection.vendor == 'postgresql':
+        return {match for row in rows
+                for match in POSTGRESQL_SEQ_SCAN.findall(row[0])}
+    scans, derived = set(), set()
+    for row in rows:
+        detail = row[-1]
+        if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE ')):
+            derived.add(detail.split()[1])
+        match = SQLITE_SCAN.match(detail)
+        if match:
+            scans.add(match.group(1))
+    # Чтение подзапроса во FROM — не обращение к таблице.
+    return scans - derived
+
+
+def capture(context):
+    """Выполняет все сценарии и собирает для каждого формы запросов
+    и таблицы, прочитанные последовательным сканированием.
+    """
+    client, anonymous_client = clients(context)
+    report = {}
+    for scenario in SCENARIOS:
+        with CaptureQueriesContext(connection) as queries:
+            perform(scenario, context, client, anonymous_client)
+        shapes, scans = {}, set()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            statement = sql.lstrip().split(None, 1)[0].upper()
+            if statement not in EXPLAINABLE + ('INSERT',):
+                continue
+            shape = query_shape(sql)
+            shapes[fingerprint(shape)] = shape[:200]
+            if statement in EXPLAINABLE:
+                scans |= sequential_scans(sql)
+        report[scenario.name] = {
+            'queries': dict(sorted(shapes.items())),
+            'seq_scans': sorted(scans),
+        }
+    return report
+
+
+def page_size_problems(context):
+    """Выполняет списки из PAGE_SIZE_SCENARIOS с каждым значением
+    PAGE_SIZES и возвращает те, где число запросов зависит от размера
+    страницы. Первый запрос прогревает кэши и не учитывается.
+    """
+    client, anonymous_client = clients(context)
+    problems = []
+    for scenario in PAGE_SIZE_SCENARIOS:
+        counts = {}
+        for limit in PAGE_SIZES[:1] + PAGE_SIZES:
+            with CaptureQueriesContext(connection) as queries:
+                perform(scenario, dict(context, limit=limit),
+                        client, anonymous_client)
+            counts[limit] = len(queries)
+        if len(set(counts.values())) > 1:
+            problems.append(
+                f'{scenario.name}: число запросов зависит от размера '
+                f'страницы {counts}')
+    return problems
+
+
+def compare(baseline, report):
+    """Возвращает список регрессий: новые формы запросов и новые
+    последовательные сканирования относительно эталона.
+    """
+    problems = []
+    for name, current in report.items():
+        expected = baseline.get(name)
+        if expected is None:
+            problems.append(f'{name}: нет в эталоне')
+            continue
+        for key, shape in current['queries'].items():
+            if key not in expected['queries']:
+                problems.append(f'{name}: новая форма запроса {shape}')
+        for table in current['seq_scans']:
+            if table not in expected['seq_scans']:
+                problems.append(
+                    f'{name}: последовательное сканирование {table}')
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('seed a dataset in a rolled back transaction, EXPLAIN the '
+            'queries of every API endpoint and compare with the baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', default=DEFAULT_BASELINE,
+            help='путь к JSON-файлу эталона')
+        parser.add_argument(
+            '--update', action='store_true',
+            help='записать текущие планы как эталон')
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with seeded_database(recipes=options['recipes'],
+                             users=options['users']) as context:
+            if connection.vendor == 'postgresql':
+                # На малом объёме планировщик выбирает Seq Scan и при
+                # наличии индекса; запрет показывает, есть ли индекс.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            report = capture(context)
+            scaling = page_size_problems(context)
+        if scaling:
+            raise CommandError(
+                'Запросы в цикле по записям:\n' + '\n'.join(scaling))
+
+        path = options['baseline']
+        baselines = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                baselines = json.load(f)
+        if options['update']:
+            baselines[connection.vendor] = report
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(baselines, f, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f'Эталон записан: {path}')
+            return
+
+        if connection.vendor not in baselines:
+            # Планы зависят от СУБД, чужой эталон для сравнения не годится.
+            raise CommandError(
+                f'Нет эталона для {connection.vendor}: запишите его '
+                f'командой с --update')
+        problems = compare(baselines[connection.vendor], report)
+        if problems:
+            raise CommandError(
+                'Регрессии планов запросов:\n' + '\n'.join(problems))
+        self.stdout.write(
+            f'Планы запросов {len(report)} сценариев совпадают с эталоном')
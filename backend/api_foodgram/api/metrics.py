@@ -0,0 +1,350 @@
+"""Замеры времени обработки запросов.
+
+Промежуточный слой считает для каждого запроса число и время
+SQL-запросов, время сериализации и полное время, отдаёт их в
+заголовке Server-Timing и накапливает гистограммы по имени маршрута.
+Каждый поток пишет в собственные гистограммы без блокировок, а
+страница метрик складывает их в момент чтения. Воркеры gunicorn
+обмениваются замерами через файлы в каталоге METRICS_DIR.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from glob import glob
+
+from django.conf import settings
+from django.db import connection
+
+SERVICE_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK')
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+UNRESOLVED = 'unresolved'
+# Как часто процесс переписывает свой файл в METRICS_DIR, секунды.
+PUBLISH_INTERVAL = 1.0
+
+# (имя, описание, корзины); порядок совпадает с порядком значений,
+# которые RequestMetricsMiddleware передаёт в Registry.observe.
+METRICS = (
+    ('foodgram_request_duration_seconds',
+     'Total time spent processing the request.', SECONDS_BUCKETS),
+    ('foodgram_request_db_seconds',
+     'Time spent executing SQL queries.', SECONDS_BUCKETS),
+    ('foodgram_request_serialization_seconds',
+     'Time spent serializing and rendering the response.', SECONDS_BUCKETS),
+    ('foodgram_request_queries',
+     'Number of SQL queries per request.', QUERIES_BUCKETS),
+)
+
+_current = threading.local()
+
+
+class Stopwatch:
+    """Накапливает время сериализации, измеренное внутри
+    ``measure_serialization``: сериализаторы с
+    TimedRepresentationMixin и рендереры с TimedRendererMixin.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+
+
+class SqlMeter:
+    """Обёртка execute_wrapper: число запросов и время в базе."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.lstrip().upper().startswith(SERVICE_STATEMENTS):
+                self.queries += 1
+                self.seconds += time.perf_counter() - start
+
+
+@contextmanager
+def serialization_timer():
+    """Засекает блок и прибавляет время ко всем активным секундомерам
+    потока. Вложенные блоки (сериализатор внутри сериализатора) не
+    считаются дважды.
+    """
+    stopwatches = getattr(_current, 'stopwatches', None)
+    if not stopwatches or getattr(_current, 'depth', 0):
+        yield
+        return
+    _current.depth = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current.depth = 0
+        elapsed = time.perf_counter() - start
+        for stopwatch in stopwatches:
+            stopwatch.total += elapsed
+
+
+@contextmanager
+def measure_serialization(stopwatch):
+    """Засекает время сериализации в текущем потоке."""
+    if not hasattr(_current, 'stopwatches'):
+        _current.stopwatches = []
+    _current.stopwatches.append(stopwatch)
+    try:
+        yield stopwatch
+    finally:
+        _current.stopwatches.remove(stopwatch)
+
+
+class TimedRepresentationMixin:
+    """Сериализатор, время to_representation которого учитывается
+    в ``measure_serialization``. При many=True ListSerializer вызывает
+    метод для каждого элемента, поэтому учитывается и список.
+    """
+
+    def to_representation(self, instance):
+        with serialization_timer():
+            return super().to_representation(instance)
+
+
+class TimedRendererMixin:
+    """Рендерер, время которого учитывается в ``measure_serialization``."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serialization_timer():
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: число наблюдений в каждой
+    корзине (последняя — +Inf), их сумма и количество.
+    """
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.add(other.counts, other.sum)
+
+    def add(self, counts, total):
+        for index, count in enumerate(counts):
+            self.counts[index] += count
+        self.sum += total
+
+
+def _histograms():
+    return [Histogram(buckets) for _, _, buckets in METRICS]
+
+
+class Registry:
+    """Гистограммы по маршрутам и методам. У каждого потока свой
+    набор, в который пишет только он; блокировка берётся лишь при
+    появлении нового потока. ``collect`` складывает наборы всех
+    потоков на момент чтения.
+
+    Если задан METRICS_DIR, процесс не реже раза в PUBLISH_INTERVAL
+    секунд переписывает в этом каталоге свой файл с гистограммами и
+    счётчиками, а ``collect`` складывает файлы всех процессов, в том
+    числе завершившихся: иначе каждый воркер отдавал бы только свои
+    замеры, и счётчики убывали бы от опроса к опросу. Каталог общий
+    для воркеров и очищается перед их запуском.
+    """
+
+    def __init__(self):
+        self._shards = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = []
+        self._published = 0.0
+        self._pid = None
+        self._path = None
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def add_counters(self, source):
+        """Подключает функцию, возвращающую счётчики процесса в формате
+        ``render_counters``.
+        """
+        self._counters.append(source)
+
+    def observe(self, route, method, values):
+        shard = self._shard()
+        histograms = shard.get((route, method))
+        if histograms is None:
+            histograms = shard[route, method] = _histograms()
+        for histogram, value in zip(histograms, values):
+            histogram.observe(value)
+        now = time.monotonic()
+        if settings.METRICS_DIR and now - self._published >= PUBLISH_INTERVAL:
+            self._published = now
+            self.publish()
+
+    def _merge_shards(self):
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for key, histograms in list(shard.items()):
+                if key not in merged:
+                    merged[key] = _histograms()
+                for total, histogram in zip(merged[key], histograms):
+                    total.merge(histogram)
+        return merged
+
+    def _process_counters(self):
+        return [sample for source in self._counters for sample in source()]
+
+    def publish(self):
+        """Записывает замеры процесса в его файл в METRICS_DIR."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        if self._pid != os.getpid():
+            # Имя не повторяет PID: файл завершившегося процесса не
+            # должен перезаписываться новым процессом с тем же PID.
+            self._pid = os.getpid()
+            self._path = os.path.join(
+                directory, f'{self._pid}-{uuid.uuid4().hex}.json')
+        snapshot = {
+            'histograms': [
+                [route, method, [[h.counts, h.sum] for h in histograms]]
+                for (route, method), histograms
+                in self._merge_shards().items()],
+            'counters': [
+                [name, value]
+                for name, kind, _, value in self._process_counters()
+                if kind == 'counter'],
+        }
+        os.makedirs(directory, exist_ok=True)
+        temporary = f'{self._path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, self._path)
+
+    def collect(self):
+        """Возвращает гистограммы {(маршрут, метод): [гистограммы в
+        порядке METRICS]} и счётчики в формате ``render_counters``.
+        Счётчики складываются по всем процессам, а показатели (gauge)
+        относятся к процессу, обработавшему запрос.
+        """
+        counters = self._process_counters()
+        if not settings.METRICS_DIR:
+            return self._merge_shards(), counters
+        self.publish()
+        merged, totals = {}, {}
+        for path in glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for route, method, rows in snapshot['histograms']:
+                histograms = merged.get((route, method))
+                if histograms is None:
+                    histograms = merged[route, method] = _histograms()
+                for histogram, (counts, total) in zip(histograms, rows):
+                    histogram.add(counts, total)
+            for name, value in snapshot['counters']:
+                totals[name] = totals.get(name, 0) + value
+        return merged, [
+            (name, kind, description,
+             totals.get(name, value) if kind == 'counter' else value)
+            for name, kind, description, value in counters]
+
+
+registry = Registry()
+# Замеры последней секунды перед штатным завершением воркера.
+atexit.register(registry.publish)
+
+
+def _escape(value):
+    return (value.replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(collected):
+    """Текстовый формат Prometheus для результата ``collect``."""
+    lines = []
+    for index, (name, description, buckets) in enumerate(METRICS):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for (route, method), histograms in sorted(collected.items()):
+            histogram = histograms[index]
+            labels = f'route="{_escape(route)}",method="{_escape(method)}"'
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},'
+                             f'le="{_format(bound)}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_counters(samples):
+    """Текстовый формат Prometheus для счётчиков без меток:
+    (имя, тип, описание, значение).
+    """
+    lines = []
+    for name, kind, description, value in samples:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {_format(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _server_timing(total, meter, stopwatch):
+    return (f'db;dur={meter.seconds * 1000:.2f};'
+            f'desc="{meter.queries} queries", '
+            f'serialize;dur={stopwatch.total * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}')
+
+
+class RequestMetricsMiddleware:
+    """Измеряет запрос целиком, поэтому стоит первым в MIDDLEWARE.
+    Тело потоковых ответов отдаётся после замера и в него не входит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        meter = SqlMeter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(meter), \
+                measure_serialization(Stopwatch()) as stopwatch:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        response['Server-Timing'] = _server_timing(total, meter, stopwatch)
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            match.url_name if match and match.url_name else UNRESOLVED,
+            request.method,
+            (total, meter.seconds, stopwatch.total, meter.queries))
+        return response
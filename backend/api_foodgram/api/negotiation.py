@@ -0,0 +1,12 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Согласование содержимого без учёта параметра ?format=.
+    Используется представлениями, которые сами обрабатывают этот
+    параметр и отдают ответ в выбранном формате.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
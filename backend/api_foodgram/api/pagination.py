@@ -1,5 +1,189 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from copy import copy
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки (keyset/cursor).
+
+    Позиция страницы задаётся значениями полей ``ordering`` последней
+    показанной записи (полей модели или аннотаций queryset), поэтому
+    выборка любой страницы идёт по индексу без OFFSET и без запроса
+    COUNT. Курсор непрозрачен для клиента.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 10
+    max_page_size = 100
+    ordering = ('-pk',)
+
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        fields = self._parse_ordering(queryset)
+        values, backwards = self.decode_cursor(request, fields)
+
+        ordering = [
+            ('-' if desc != backwards else '') + name
+            for name, _, desc in fields]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(
+                self._after(fields, values, backwards))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if backwards:
+            results.reverse()
+
+        self.next_values = self.previous_values = None
+        if results:
+            first, last = results[0], results[-1]
+            if has_more or backwards:
+                self.next_values = self._values(fields, last)
+            if values is not None and (has_more or not backwards):
+                self.previous_values = self._values(fields, first)
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.encode_cursor(self.next_values, False)),
+            ('previous', self.encode_cursor(self.previous_values, True)),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def _parse_ordering(self, queryset):
+        fields = []
+        for item in self.ordering:
+            name = item.lstrip('-')
+            if name == 'pk':
+                field = queryset.model._meta.pk
+            elif name in queryset.query.annotations:
+                field = copy(queryset.query.annotations[name].output_field)
+                field.set_attributes_from_name(name)
+            else:
+                field = queryset.model._meta.get_field(name)
+            fields.append((name, field, item.startswith('-')))
+        return fields
+
+    def _after(self, fields, values, backwards):
+        """Строит условие «строго после позиции» для составного ключа:
+        (a < x) OR (a = x AND b < y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for (name, _, desc), value in zip(fields, values):
+            lookup = 'lt' if desc != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _values(self, fields, obj):
+        return [field.value_to_string(obj) for _, field, _ in fields]
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = [field.to_python(value) for (_, field, _), value
+                      in zip(fields, payload['v'])]
+            backwards = bool(payload.get('r'))
+        except (binascii.Error, KeyError, TypeError, ValueError,
+                UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        return values, backwards
+
+    def encode_cursor(self, values, backwards):
+        if values is None:
+            return None
+        payload = {'v': values}
+        if backwards:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(payload).encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с параметром ?limit=.
+
+    Если задан ``keyset_ordering`` и в запросе есть параметр ?cursor=
+    (в том числе пустой для первой страницы), используется
+    KeysetPagination по этим полям: без COUNT и без OFFSET.
+    """
     page_size_query_param = 'limit'
+    keyset_ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (self.keyset_ordering is not None
+                and KeysetPagination.cursor_query_param
+                in request.query_params):
+            self.keyset = KeysetPagination()
+            self.keyset.ordering = self.get_keyset_ordering(queryset)
+            if self.max_page_size is not None:
+                self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_keyset_ordering(self, queryset):
+        return self.keyset_ordering
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPageNumberPagination):
+    keyset_ordering = ('-pub_date', '-pk')
+
+    def get_keyset_ordering(self, queryset):
+        # Результаты поиска листаются в порядке ранга совпадения.
+        if 'rank' in queryset.query.annotations:
+            return ('-rank', '-pk')
+        return super().get_keyset_ordering(queryset)
+
+
+class SubscriptionsPagination(CustomPageNumberPagination):
+    keyset_ordering = ('pk',)
+
+
+class FeedPagination(KeysetPagination):
+    ordering = ('-feed_id',)
+    page_size = settings.FEED_PAGE_SIZE
+    max_page_size = settings.FEED_MAX_PAGE_SIZE
+
+
+class UserPagination(CustomPageNumberPagination):
+    page_size = settings.USERS_PAGE_SIZE
+    max_page_size = settings.USERS_MAX_PAGE_SIZE
+    keyset_ordering = ('pk',)
@@ -0,0 +1,310 @@
+"""Сценарии запросов ко всем маршрутам API на сгенерированных данных.
+
+Используются командами проверки планов запросов и замера
+производительности. Данные создаются внутри транзакции, которая
+откатывается по выходе из ``seeded_database``, а кэш и каталог
+медиафайлов на это время подменяются, поэтому рабочие база, кэш и
+файлы не затрагиваются.
+"""
+import base64
+import random
+from contextlib import contextmanager
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from typing import Any, NamedTuple, Optional
+
+from api.authentication import token_cache
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image
+from recipes.feed import rebuild as rebuild_feeds
+from recipes.ingredient_search import ingredient_index
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import rebuild
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+User = get_user_model()
+
+PASSWORD = 'seed-password'
+WORDS = (
+    'суп', 'салат', 'каша', 'пирог', 'котлеты', 'рагу', 'блины', 'паста',
+    'омлет', 'плов', 'запеканка', 'соус', 'курица', 'рыба', 'овощи',
+    'грибы', 'сыр', 'рис', 'картофель', 'тыква',
+)
+ISOLATED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-scenarios',
+    },
+}
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class Scenario(NamedTuple):
+    """Один запрос к API. ``path`` и строковые значения ``data``
+    подставляются из контекста сгенерированных данных; ``store``
+    сохраняет id из ответа в контекст для следующих сценариев.
+    """
+    name: str
+    method: str
+    path: str
+    data: Any = None
+    status: int = 200
+    store: Optional[str] = None
+    anonymous: bool = False
+
+
+def _image_data_uri():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), (200, 120, 40)).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+
+def _recipe_payload(context):
+    return {
+        'name': 'Тестовый рецепт',
+        'text': 'Описание тестового рецепта',
+        'cooking_time': 15,
+        'image': context['image'],
+        'tags': context['tag_ids'][:2],
+        'ingredients': [{'id': pk, 'amount': 10}
+                        for pk in context['ingredient_ids'][:5]],
+    }
+
+
+def _recipe_patch(context):
+    return {
+        'name': 'Обновлённый рецепт',
+        'text': 'Новое описание',
+        'cooking_time': 20,
+        'image': context['image'],
+        'tags': context['tag_ids'][1:3],
+        'ingredients': [{'id': pk, 'amount': 20}
+                        for pk in context['ingredient_ids'][3:8]],
+    }
+
+
+# Порядок важен: каждое изменение следом отменяется, поэтому прогон
+# всех сценариев можно повторять на тех же данных.
+SCENARIOS = (
+    Scenario('tags_list', 'get', '/api/tags/'),
+    Scenario('tag_detail', 'get', '/api/tags/{tag}/'),
+    Scenario('ingredients_search', 'get',
+             '/api/ingredients/?name={ingredient_prefix}'),
+    Scenario('ingredient_detail', 'get', '/api/ingredients/{ingredient}/'),
+    Scenario('recipes_list', 'get', '/api/recipes/?page=2&limit=10'),
+    Scenario('recipes_list_anonymous', 'get', '/api/recipes/?limit=10',
+             anonymous=True),
+    Scenario('recipes_cursor', 'get', '/api/recipes/?cursor=&limit=10'),
+    Scenario('recipes_filtered', 'get',
+             '/api/recipes/?tags={tag_slug}&is_favorited=1&limit=10'),
+    Scenario('recipes_search', 'get',
+             '/api/recipes/?search={search_word}&limit=10'),
+    Scenario('recipe_detail', 'get', '/api/recipes/{recipe}/'),
+    Scenario('recipes_feed', 'get', '/api/recipes/feed/?limit=10'),
+    Scenario('recipe_create', 'post', '/api/recipes/', _recipe_payload,
+             status=201, store='created'),
+    Scenario('recipe_update', 'patch', '/api/recipes/{created}/',
+             _recipe_patch),
+    Scenario('recipe_delete', 'delete', '/api/recipes/{created}/',
+             status=204),
+    Scenario('favorite_add', 'post', '/api/recipes/{recipe}/favorite/'),
+    Scenario('favorite_remove', 'delete', '/api/recipes/{recipe}/favorite/',
+             status=204),
+    Scenario('favorite_batch_add', 'post', '/api/recipes/favorite/',
+             {'ids': '{batch}'}),
+    Scenario('favorite_batch_remove', 'delete', '/api/recipes/favorite/',
+             {'ids': '{batch}'}),
+    Scenario('cart_add', 'post', '/api/recipes/{recipe}/shopping_cart/'),
+    Scenario('cart_remove', 'delete', '/api/recipes/{recipe}/shopping_cart/',
+             status=204),
+    Scenario('cart_batch_add', 'post', '/api/recipes/shopping_cart/',
+             {'ids': '{batch}'}),
+    Scenario('cart_batch_remove', 'delete', '/api/recipes/shopping_cart/',
+             {'ids': '{batch}'}),
+    Scenario('download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/'),
+    Scenario('subscribe', 'post', '/api/users/{author}/subscribe/',
+             status=201),
+    Scenario('unsubscribe', 'delete', '/api/users/{author}/subscribe/',
+             status=204),
+    Scenario('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3&limit=10'),
+    Scenario('users_list', 'get', '/api/users/?page=2&limit=10'),
+    Scenario('users_search', 'get',
+             '/api/users/?search={username_prefix}&limit=10'),
+    Scenario('user_me', 'get', '/api/users/me/'),
+    Scenario('user_detail', 'get', '/api/users/{author}/'),
+    Scenario('metrics', 'get', '/api/metrics/'),
+    Scenario('token_login', 'post', '/api/auth/token/login/',
+             {'email': '{email}', 'password': PASSWORD}, anonymous=True),
+)
+
+# Списки, в которых число запросов не должно зависеть от размера
+# страницы: каждый выполняется со всеми значениями PAGE_SIZES.
+PAGE_SIZES = (5, 50)
+PAGE_SIZE_SCENARIOS = (
+    Scenario('recipes_list', 'get', '/api/recipes/?limit={limit}'),
+    Scenario('recipes_list_anonymous', 'get', '/api/recipes/?limit={limit}',
+             anonymous=True),
+    Scenario('recipes_cursor', 'get', '/api/recipes/?cursor=&limit={limit}'),
+    Scenario('recipes_feed', 'get', '/api/recipes/feed/?limit={limit}'),
+    Scenario('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3&limit={limit}'),
+    Scenario('users_list', 'get', '/api/users/?limit={limit}'),
+)
+
+
+def _bulk_create(model, objs):
+    """Пакетно создаёт объекты и возвращает их id: SQLite не отдаёт
+    id из bulk_create, поэтому они выбираются по возрастанию pk.
+    """
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    model.objects.bulk_create(objs)
+    return list(model.objects.filter(pk__gt=last or 0).order_by(
+        'pk').values_list('pk', flat=True))
+
+
+def seed(recipes=2000, users=200, tags=20, ingredients=500,
+         random_seed=0):
+    """Создаёт связанный набор данных пакетными INSERT и возвращает
+    контекст для подстановки в сценарии. Первый созданный пользователь
+    выполняет запросы: у него есть избранное, корзина, подписки и
+    права персонала для страницы метрик.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    user_ids = _bulk_create(User, (
+        User(username=f'seed{random_seed}_{i}',
+             email=f'seed{random_seed}_{i}@example.com',
+             first_name='Seed', last_name=str(i), password=password)
+        for i in range(users)))
+    tag_ids = _bulk_create(Tag, (
+        Tag(name=f'seed tag {i}', color=f'#seed{i:03d}',
+            slug=f'seed-tag-{i}')
+        for i in range(tags)))
+    ingredient_ids = _bulk_create(Ingredient, (
+        Ingredient(name=f'{WORDS[i % len(WORDS)]} {i}',
+                   measurement_unit='г')
+        for i in range(ingredients)))
+    recipe_ids = _bulk_create(Recipe, (
+        Recipe(author_id=rng.choice(user_ids[1:] or user_ids),
+               name=f'{rng.choice(WORDS).capitalize()} {i}',
+               text=' '.join(rng.choices(WORDS, k=12)),
+               cooking_time=rng.randint(5, 120),
+               image='recipes/images/seed.png')
+        for i in range(recipes)))
+
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rng.sample(tag_ids, min(3, len(tag_ids))))
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe_id=recipe_id, ingredient_id=pk,
+                         amount=rng.randint(1, 500))
+        for recipe_id in recipe_ids
+        for pk in rng.sample(ingredient_ids, min(8, len(ingredient_ids))))
+
+    acting, others = user_ids[0], user_ids[1:] or user_ids
+    User.objects.filter(pk=acting).update(is_staff=True)
+    reserved = set(rng.sample(recipe_ids, 6))
+    available = [pk for pk in recipe_ids if pk not in reserved]
+    for model, per_user, own in ((Favorite, 10, 30),
+                                 (ShoppingCart, 3, 10)):
+        model.objects.bulk_create(
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(
+                available, min(own if user_id == acting else per_user,
+                               len(available))))
+    followed = rng.sample(others, min(20, len(others)))
+    Subscription.objects.bulk_create(
+        [Subscription(subscriber_id=acting, author_id=author_id)
+         for author_id in followed]
+        + [Subscription(subscriber_id=user_id, author_id=author_id)
+           for user_id in others
+           for author_id in rng.sample(user_ids, min(5, len(user_ids)))
+           if author_id != user_id])
+    rebuild(user_ids)
+    rebuild_feeds(user_ids)
+
+    reserved = sorted(reserved)
+    return {
+        'user': acting,
+        'email': f'seed{random_seed}_0@example.com',
+        'username_prefix': f'SEED{random_seed}_1',
+        'token': Token.objects.create(user_id=acting).key,
+        'author': next(pk for pk in others if pk not in followed),
+        'recipe': reserved[0],
+        'batch': reserved[1:],
+        'tag': tag_ids[0],
+        'tag_ids': tag_ids,
+        'tag_slug': 'seed-tag-0',
+        'ingredient': ingredient_ids[0],
+        'ingredient_ids': ingredient_ids,
+        'ingredient_prefix': WORDS[0][:2],
+        'search_word': WORDS[1],
+        'image': _image_data_uri(),
+    }
+
+
+@contextmanager
+def seeded_database(**sizes):
+    """Генерирует данные в транзакции, которая откатывается на выходе.
+    Загруженные изображения сохраняются во временный каталог.
+    """
+    with TemporaryDirectory() as media_root, override_settings(
+            CACHES=ISOLATED_CACHES, MEDIA_ROOT=media_root):
+        try:
+            with transaction.atomic():
+                yield seed(**sizes)
+                transaction.set_rollback(True)
+        finally:
+            ingredient_index.invalidate()
+            token_cache.clear()
+
+
+def clients(context):
+    """Клиенты API: аутентифицированный по токену и анонимный."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {context["token"]}')
+    return client, APIClient()
+
+
+def _fill(value, context):
+    if callable(value):
+        return value(context)
+    if isinstance(value, dict):
+        return {key: _fill(item, context) for key, item in value.items()}
+    if isinstance(value, str) and value.startswith('{'):
+        return context[value.strip('{}')]
+    return value
+
+
+def perform(scenario, context, client, anonymous_client):
+    """Выполняет сценарий и дочитывает потоковый ответ целиком."""
+    path = scenario.path.format(**context)
+    data = _fill(scenario.data, context)
+    response = getattr(
+        anonymous_client if scenario.anonymous else client,
+        scenario.method)(path, data, format='json')
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    if response.status_code != scenario.status:
+        raise ScenarioError(
+            f'{scenario.name}: {scenario.method.upper()} {path} -> '
+            f'{response.status_code} {content[:300]!r}')
+    if scenario.store:
+        context[scenario.store] = response.data['id']
+    return response
@@ -1,26 +1,47 @@
 import base64
+import binascii
+from collections import Counter
+from tempfile import SpooledTemporaryFile
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
 from django.core.validators import MinValueValidator
 from django.db import transaction
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from recipes.images import variant_url
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.relations import get_user_relations
+from recipes.shopping_list import change_recipe_ingredients
 from users.models import Subscription
 
+from .metrics import TimedRepresentationMixin
+
 User = get_user_model()
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+def get_relations(serializer):
+    """Возвращает снимок связей текущего пользователя, загружая его
+    один раз на весь корневой сериализатор.
+    """
+    context = serializer.context
+    if 'relations' not in context:
+        context['relations'] = get_user_relations(context['request'].user)
+    return context['relations']
+
+
+class CustomUserSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-
-        user = self.context['request'].user
-        return (user.is_authenticated
-                and obj.subscription_author.filter(
-                    subscriber=user).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_relations(self).following
 
     class Meta:
         model = User
@@ -34,7 +55,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         )
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(TimedRepresentationMixin,
+                             serializers.ModelSerializer):
     subscriber = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all()
     )
@@ -64,16 +86,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return data
 
 
-class RecipesForActionsSerializer(serializers.ModelSerializer):
+class RecipesForActionsSerializer(TimedRepresentationMixin,
+                                  serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('name', 'image', 'id', 'cooking_time')
 
 
-class AuthorSubscriptionSerializer(serializers.ModelSerializer):
+class AuthorSubscriptionSerializer(TimedRepresentationMixin,
+                                   serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
     def get_recipes(self, obj):
@@ -85,10 +107,9 @@ class AuthorSubscriptionSerializer(serializers.ModelSerializer):
             recipes, many=True).data
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (user.is_authenticated
-                and obj.subscription_author.filter(
-                    subscriber=user).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_relations(self).following
 
     class Meta:
         model = User
@@ -100,23 +121,28 @@ class AuthorSubscriptionSerializer(serializers.ModelSerializer):
             'last_name',
             'recipes',
             'recipes_count',
+            'followers_count',
             'is_subscribed'
         )
+        read_only_fields = ('recipes_count', 'followers_count')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedRepresentationMixin,
+                    serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedRepresentationMixin,
+                         serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(
         queryset=Recipe.objects.all()
     )
@@ -137,7 +163,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ]
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(TimedRepresentationMixin,
+                             serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(
         queryset=Recipe.objects.all()
     )
@@ -158,7 +185,16 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         ]
 
 
-class IngredientRecipeSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE
+    )
+
+
+class IngredientRecipeSerializer(TimedRepresentationMixin,
+                                 serializers.ModelSerializer):
     name = serializers.StringRelatedField(
         source='ingredient.name',
     )
@@ -175,17 +211,35 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('name', 'measurement_unit', 'id', 'amount')
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
     author = CustomUserSerializer()
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
-    is_favorited = serializers.BooleanField()
-    is_in_shopping_cart = serializers.BooleanField()
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
+
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        variant = ('thumbnail'
+                   if isinstance(self.parent, serializers.ListSerializer)
+                   else 'detail')
+        url = variant_url(obj.image, variant,
+                          obj.image_variants == obj.image.name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
     def get_ingredients(self, obj):
         return IngredientRecipeSerializer(
-            IngredientRecipe.objects.filter(recipe=obj).all(),
-            many=True).data
+            obj.recipes.all(), many=True).data
+
+    def get_is_favorited(self, obj):
+        return obj.pk in get_relations(self).favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        return obj.pk in get_relations(self).shopping_cart
 
     class Meta:
         model = Recipe
@@ -195,15 +249,101 @@ class RecipeListSerializer(serializers.ModelSerializer):
                   'ingredients',
                   'is_favorited',
                   'is_in_shopping_cart',
+                  'favorites_count',
                   'name',
                   'image',
                   'text',
                   'cooking_time')
 
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, разрешающий id пачкой: при many=True
+    все значения поля загружаются одним запросом IN, а во вложенном
+    списке сериализаторов одним запросом загружаются id, заранее
+    переданные в ``preload``.
+    """
+    default_error_messages = {
+        'does_not_exist_many': 'Недопустимые первичные ключи: {pk_values}.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def _to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def preload(self, values):
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self._to_pk(value))
+            except serializers.ValidationError:
+                pass
+        self._loaded = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        loaded = getattr(self, '_loaded', None)
+        if loaded is None:
+            return super().to_internal_value(data)
+        pk = self._to_pk(data)
+        if pk not in loaded:
+            self.fail('does_not_exist', pk_value=data)
+        return loaded[pk]
+
+    def resolve_many(self, values):
+        """Объекты в порядке ``values``; все неизвестные id
+        перечисляются в одной ошибке.
+        """
+        self.preload(values)
+        objects, missing = [], []
+        for value in values:
+            try:
+                objects.append(self.to_internal_value(value))
+            except serializers.ValidationError:
+                missing.append(value)
+        if missing:
+            self.fail('does_not_exist_many',
+                      pk_values=', '.join(map(str, missing)))
+        return objects
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.resolve_many(list(data))
+
+
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Загружает ингредиенты всех элементов списка одним запросом
+    до проверки элементов по отдельности.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields['id'].preload(
+                item['id'] for item in data
+                if isinstance(item, dict) and 'id' in item)
+        return super().to_internal_value(data)
+
+
 class AddIngredientForRecipeSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(read_only=True)
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         source='ingredient',
         queryset=Ingredient.objects.all()
     )
@@ -213,32 +353,59 @@ class AddIngredientForRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientRecipe
         fields = ('recipe', 'id', 'amount')
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class Base64ImageFile(serializers.ImageField):
+    """Принимает изображение в виде data URI. Размер проверяется до
+    декодирования, а base64 декодируется частями во временный файл.
+    """
+    default_error_messages = {
+        'too_large': 'Размер изображения превышает {max_bytes} байт',
+        'invalid_base64': 'Некорректные данные изображения',
+    }
+    decode_chunk_size = 64 * 1024
+
     def to_internal_value(self, data):
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
         if isinstance(data, str) and data.startswith('data:image'):
             end_img, image = data.split(';base64,')
             extension = end_img.split('/')[-1]
-            data = ContentFile(base64.b64decode(image),
-                               name='photo.' + extension)
+            if len(image) // 4 * 3 > max_bytes:
+                self.fail('too_large', max_bytes=max_bytes)
+            data = self.decode(image, name='photo.' + extension)
+        elif getattr(data, 'size', 0) > max_bytes:
+            self.fail('too_large', max_bytes=max_bytes)
         return super().to_internal_value(data)
 
-
-class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
+    def decode(self, image, name):
+        buffer = SpooledTemporaryFile(max_size=self.decode_chunk_size)
+        try:
+            for start in range(0, len(image), self.decode_chunk_size):
+                buffer.write(base64.b64decode(
+                    image[start:start + self.decode_chunk_size],
+                    validate=True))
+        except binascii.Error:
+            self.fail('invalid_base64')
+        buffer.seek(0)
+        return File(buffer, name=name)
+
+
+class CreateUpdateRecipeSerializer(TimedRepresentationMixin,
+                                   serializers.ModelSerializer):
     ingredients = AddIngredientForRecipeSerializer(
         many=True, source='ingredientrecipe_set'
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
     image = Base64ImageFile()
-    author = CustomUserSerializer(required=False)
+    author = CustomUserSerializer(read_only=True)
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'search_vector')
 
     @transaction.atomic
     def create(self, validated_data):
@@ -255,6 +422,8 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
             for ingredient in ingredients]
         IngredientRecipe.objects.bulk_create(
             create_ingredients)
+        self.saved_tags = tags
+        self.saved_ingredients = create_ingredients
         return recipe
 
     @transaction.atomic
@@ -262,33 +431,79 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop(
             'ingredientrecipe_set', None)
         tags = validated_data.pop('tags', None)
+        # Без переданных тегов и ингредиентов ответ строится из уже
+        # загруженных представлением связей: после сохранения DRF
+        # сбрасывает кэш prefetch_related объекта.
         if tags is not None:
             instance.tags.set(tags)
+        else:
+            tags = list(instance.tags.all())
         if ingredients is not None:
-            instance.ingredients.clear()
-            create_ingredients = [
-                IngredientRecipe(
-                    recipe=instance,
-                    ingredient=ingredient['ingredient'],
-                    amount=ingredient['amount'])
-                for ingredient in ingredients]
-
-            IngredientRecipe.objects.bulk_create(
-                create_ingredients)
+            self.saved_ingredients = self.update_ingredients(
+                instance, ingredients)
+        else:
+            self.saved_ingredients = list(instance.recipes.all())
+        self.saved_tags = tags
         return super().update(instance, validated_data)
 
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        """Сравнивает присланный состав с сохранённым и выполняет только
+        нужные DELETE, UPDATE и INSERT. Ингредиенты в составе не
+        повторяются (см. validate_ingredients). Возвращает новый состав.
+        """
+        existing = {row.ingredient_id: row
+                    for row in instance.recipes.all()}
+        old_amounts = {pk: row.amount for pk, row in existing.items()}
+        rows, changed, created = [], [], []
+        for ingredient in ingredients:
+            row = existing.pop(ingredient['ingredient'].pk, None)
+            if row is None:
+                row = IngredientRecipe(recipe=instance,
+                                       ingredient=ingredient['ingredient'],
+                                       amount=ingredient['amount'])
+                created.append(row)
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                changed.append(row)
+            row.ingredient = ingredient['ingredient']
+            rows.append(row)
+
+        if existing:
+            IngredientRecipe.objects.filter(
+                pk__in=[row.pk for row in existing.values()]).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        if created:
+            IngredientRecipe.objects.bulk_create(created)
+        change_recipe_ingredients(
+            instance.pk, old_amounts,
+            {row.ingredient_id: row.amount for row in rows})
+        return rows
+
     def to_representation(self, obj):
+        """Теги и ингредиенты берутся из только что сохранённых данных,
+        признаки избранного и списка покупок — из снимка связей
+        пользователя, поэтому ответ не перечитывает рецепт из базы.
+        """
         self.fields.pop('ingredients')
-        self.fields['tags'] = TagSerializer(many=True)
+        self.fields.pop('tags')
         representation = super().to_representation(obj)
+        tags = getattr(self, 'saved_tags', None)
+        if tags is None:
+            tags = obj.tags.all()
+        ingredients = getattr(self, 'saved_ingredients', None)
+        if ingredients is None:
+            ingredients = IngredientRecipe.objects.filter(
+                recipe=obj).select_related('ingredient')
+        representation['tags'] = TagSerializer(tags, many=True).data
         representation['ingredients'] = IngredientRecipeSerializer(
-            IngredientRecipe.objects.filter(
-                recipe=obj).all(), many=True).data
+            ingredients, many=True).data
 
-        representation['is_favorited'] = Favorite.objects.filter(
-            user__id=obj.author.id, recipe__pk=obj.id).exists()
-        representation['is_in_shopping_cart'] = ShoppingCart.objects.filter(
-            user__id=obj.author.id, recipe__pk=obj.id).exists()
+        relations = get_relations(self)
+        representation['is_favorited'] = obj.pk in relations.favorites
+        representation['is_in_shopping_cart'] = (
+            obj.pk in relations.shopping_cart)
         return representation
 
     def validate_tags(self, data):
@@ -300,4 +515,10 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
         ingredients = self.initial_data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError('Выберите ингредиент')
+        counts = Counter(item['ingredient'].pk for item in data)
+        duplicates = [pk for pk, count in counts.items() if count > 1]
+        if duplicates:
+            raise serializers.ValidationError(
+                'Ингредиенты указаны несколько раз: '
+                + ', '.join(map(str, duplicates)))
         return data
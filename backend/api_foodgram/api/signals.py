@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+
+User = get_user_model()
+
+# Поля, изменение которых не влияет на аутентификацию и ответы
+# с данными пользователя: их сохранение не сбрасывает кэш токенов.
+TOKEN_CACHE_IGNORED_FIELDS = frozenset({'last_login'})
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_token(instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields=None,
+                           **kwargs):
+    # Смена пароля, деактивация и правка профиля сохраняют
+    # пользователя; у нового пользователя токенов в кэше ещё нет.
+    if created:
+        return
+    if (update_fields is not None
+            and set(update_fields) <= TOKEN_CACHE_IGNORED_FIELDS):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: [invalidate_token(key) for key in keys])
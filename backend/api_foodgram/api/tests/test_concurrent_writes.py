@@ -0,0 +1,101 @@
+import threading
+from collections import Counter
+
+from api.authentication import token_cache
+from api.scenarios import ISOLATED_CACHES, seed
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from recipes.ingredient_search import ingredient_index
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.shopping_list import actual_totals, stored_totals
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def hammer(token, method, path, threads):
+    """Отправляет один и тот же запрос из ``threads`` потоков,
+    стартующих одновременно. Возвращает Counter кодов ответа.
+    """
+    barrier = threading.Barrier(threads)
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            barrier.wait()
+            try:
+                code = getattr(client, method)(path).status_code
+            except Exception as error:
+                code = type(error).__name__
+            with lock:
+                statuses[code] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return statuses
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class ConcurrentWritesTest(TransactionTestCase):
+    """Одинаковые запросы на добавление и удаление из параллельных
+    потоков: ровно один проходит, строка одна, счётчик и список
+    покупок не расходятся. Потоки работают через собственные
+    соединения, поэтому нужна TransactionTestCase.
+    """
+    THREADS = 8
+    ROUNDS = 3
+
+    def setUp(self):
+        self.context = seed(recipes=50, users=30)
+        self.user = User.objects.get(pk=self.context['user'])
+        self.recipe = Recipe.objects.get(pk=self.context['recipe'])
+        self.author = User.objects.get(pk=self.context['author'])
+
+    def tearDown(self):
+        ingredient_index.invalidate()
+        token_cache.clear()
+
+    def assertOneWins(self, path, created, rows, counter):
+        before = counter()
+        for _ in range(self.ROUNDS):
+            for method, success, count in (('post', created, 1),
+                                           ('delete', 204, 0)):
+                statuses = hammer(self.context['token'], method, path,
+                                  self.THREADS)
+                self.assertEqual(
+                    statuses, Counter({success: 1, 400: self.THREADS - 1}),
+                    f'{method.upper()} {path}')
+                self.assertEqual(rows().count(), count)
+                self.assertEqual(counter(), before + count)
+
+    def test_favorite(self):
+        self.assertOneWins(
+            f'/api/recipes/{self.recipe.pk}/favorite/', 200,
+            lambda: Favorite.objects.filter(
+                user=self.user, recipe=self.recipe),
+            lambda: Recipe.objects.get(pk=self.recipe.pk).favorites_count)
+
+    def test_shopping_cart(self):
+        self.assertOneWins(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/', 200,
+            lambda: ShoppingCart.objects.filter(
+                user=self.user, recipe=self.recipe),
+            lambda: Recipe.objects.get(pk=self.recipe.pk).in_carts_count)
+        self.assertEqual(actual_totals(), stored_totals())
+
+    def test_subscribe(self):
+        self.assertOneWins(
+            f'/api/users/{self.author.pk}/subscribe/', 201,
+            lambda: Subscription.objects.filter(
+                subscriber=self.user, author=self.author),
+            lambda: User.objects.get(pk=self.author.pk).followers_count)
@@ -0,0 +1,66 @@
+from api.authentication import token_cache
+from api.scenarios import (ISOLATED_CACHES, PAGE_SIZE_SCENARIOS, PAGE_SIZES,
+                           Scenario, clients, perform, seed)
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.ingredient_search import ingredient_index
+from recipes.models import Ingredient, IngredientRecipe
+
+RECIPE_DETAIL = Scenario('recipe_detail', 'get', '/api/recipes/{recipe}/')
+SUBSCRIPTIONS = Scenario(
+    'subscriptions', 'get',
+    '/api/users/subscriptions/?recipes_limit={recipes_limit}&limit=10')
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class QueryCountTest(TestCase):
+    """Число запросов списков и карточки рецепта не зависит от числа
+    выводимых объектов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.context = seed(recipes=150, users=60)
+
+    def setUp(self):
+        self.api_client, self.anonymous_client = clients(self.context)
+
+    def tearDown(self):
+        ingredient_index.invalidate()
+        token_cache.clear()
+
+    def count_queries(self, scenario, **values):
+        with CaptureQueriesContext(connection) as queries:
+            perform(scenario, dict(self.context, **values),
+                    self.api_client, self.anonymous_client)
+        return len(queries)
+
+    def assertSameQueryCount(self, scenario, name, values):
+        """Выполняет сценарий со значениями ``name`` из ``values``.
+        Первый запрос прогревает кэши и не учитывается.
+        """
+        self.count_queries(scenario, **{name: values[0]})
+        counts = {value: self.count_queries(scenario, **{name: value})
+                  for value in values}
+        self.assertEqual(len(set(counts.values())), 1,
+                         f'{scenario.name}: {counts}')
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for scenario in PAGE_SIZE_SCENARIOS:
+            with self.subTest(scenario.name):
+                self.assertSameQueryCount(scenario, 'limit', PAGE_SIZES)
+
+    def test_subscriptions_query_count_does_not_depend_on_recipes_limit(
+            self):
+        self.assertSameQueryCount(SUBSCRIPTIONS, 'recipes_limit', (3, 30))
+
+    def test_recipe_detail_query_count_does_not_depend_on_ingredients(self):
+        small, large = self.context['batch'][:2]
+        used = IngredientRecipe.objects.filter(
+            recipe_id=large).values('ingredient_id')
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe_id=large, ingredient_id=pk, amount=1)
+            for pk in Ingredient.objects.exclude(pk__in=used).values_list(
+                'pk', flat=True)[:40])
+        self.assertSameQueryCount(RECIPE_DETAIL, 'recipe', (small, large))
@@ -1,7 +1,8 @@
-from api.views import (FavoriteViewSet, IngredientViewSet, RecipeViewSet,
-                       ShoppingCartApiView, SubscriptionsViewSet,
-                       SubscriptionViewSet, TagViewSet, UserCreateListRetrieve,
-                       download_shopping_cart)
+from api.views import (DownloadShoppingCartApiView, FavoriteBatchApiView,
+                       FavoriteViewSet, IngredientViewSet, MetricsApiView,
+                       RecipeViewSet, ShoppingCartApiView,
+                       ShoppingCartBatchApiView, SubscriptionsViewSet,
+                       SubscriptionViewSet, TagViewSet, UserCreateListRetrieve)
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -28,12 +29,17 @@ urlpatterns = [
          SubscriptionsViewSet.as_view({'get': 'list'}),
          name='subscriptions'),
     path('users/<user_id>/subscribe/', subscription, name='subscribe'),
+    path('recipes/favorite/', FavoriteBatchApiView.as_view(),
+         name='favorite_batch'),
+    path('recipes/shopping_cart/', ShoppingCartBatchApiView.as_view(),
+         name='shopping_cart_batch'),
     path('recipes/<recipe_id>/favorite/',
          favorite, name='favorite'),
-    path('recipes/download_shopping_cart/', download_shopping_cart,
-         name='download'),
+    path('recipes/download_shopping_cart/',
+         DownloadShoppingCartApiView.as_view(), name='download'),
     path('recipes/<recipe_id>/shopping_cart/', ShoppingCartApiView.as_view(),
          name='shopping_cart'),
+    path('metrics/', MetricsApiView.as_view(), name='metrics'),
     path('users/<user_id>/', user_value, name='get_user_or_set_password'),
     path('', include(router.urls)),
     path(r'auth/', include('djoser.urls.authtoken')),
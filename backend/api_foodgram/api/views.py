@@ -1,29 +1,83 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Q, Value
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import mixins, permissions, status, viewsets
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.batch import (add_recipe, add_recipes, remove_recipe,
+                           remove_recipes, subscribe, unsubscribe)
+from recipes.ingredient_search import ingredient_index
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.versions import INGREDIENTS, TAGS
 from users.models import Subscription
 
-from .pagination import CustomPageNumberPagination
+from .caching import CachedReferenceMixin
+from .exporters import EXPORTERS, ExportTimeout
+from .metrics import registry, render_counters, render_prometheus
+from .negotiation import IgnoreFormatContentNegotiation
+from .pagination import (FeedPagination, RecipePagination,
+                         SubscriptionsPagination, UserPagination)
 from .permissions import ReadAndOwner
 from .serializers import (AuthorSubscriptionSerializer,
                           CreateUpdateRecipeSerializer, CustomUserSerializer,
                           FavoriteSerializer, IngredientSerializer,
-                          RecipeListSerializer, RecipesForActionsSerializer,
-                          ShoppingCartSerializer, SubscriptionSerializer,
+                          RecipeIdsSerializer, RecipeListSerializer,
+                          RecipesForActionsSerializer, SubscriptionSerializer,
                           TagSerializer)
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    """Возвращает значение параметра recipes_limit или None,
+    если параметр не передан или некорректен.
+    """
+    try:
+        recipes_limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
+def error_response(message):
+    """Ошибка 400 в том же виде, что и ошибка валидации сериализатора."""
+    return Response({api_settings.NON_FIELD_ERRORS_KEY: [message]},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
+def get_action_recipe(recipe_id):
+    """Рецепт с полями RecipesForActionsSerializer или 404."""
+    return get_object_or_404(
+        Recipe.objects.only('name', 'image', 'cooking_time'), id=recipe_id)
+
+
+def add_recipe_response(model, request, recipe_id, message):
+    recipe = get_action_recipe(recipe_id)
+    if not add_recipe(model, request.user, recipe.pk):
+        return error_response(message)
+    return Response(RecipesForActionsSerializer(
+        recipe, context={'request': request}).data,
+        status=status.HTTP_200_OK)
+
+
+def remove_recipe_response(model, request, recipe_id, message):
+    """Удаляет связь одним DELETE; рецепт ищется, только если
+    удалять было нечего, чтобы отличить 404 от 400.
+    """
+    if remove_recipe(model, request.user, recipe_id):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(Recipe, id=recipe_id)
+    return Response({'message': message},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
 class CreateDeleteViewSet(mixins.CreateModelMixin,
                           mixins.DestroyModelMixin,
                           viewsets.GenericViewSet):
@@ -33,11 +87,33 @@ class CreateDeleteViewSet(mixins.CreateModelMixin,
 class UserCreateListRetrieve(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = UserPagination
+
+    def get_list_queryset(self):
+        """Все пользователи, без скрытия djoser HIDE_USERS. Признак
+        подписки вычисляется в том же запросе, ?search= ищет по началу
+        имени пользователя или email (индексы из миграции users 0006).
+        """
+        user = self.request.user
+        if user.is_authenticated:
+            is_subscribed = Exists(Subscription.objects.filter(
+                subscriber=user, author=OuterRef('pk')))
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        queryset = User.objects.only(
+            'email', 'first_name', 'last_name', 'username'
+        ).annotate(is_subscribed=is_subscribed).order_by('pk')
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(
+                Q(username__istartswith=search)
+                | Q(email__istartswith=search))
+        return queryset
 
     def list(self, request, *args, **kwargs):
-        return Response(self.get_serializer(
-            self.queryset, many=True).data)
+        page = self.paginate_queryset(self.get_list_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def get_user(self, request, user_id=None, *args, **kwargs):
@@ -54,27 +130,25 @@ class SubscriptionViewSet(CreateDeleteViewSet):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def create(self, request, *args, **kwargs):
-        subscriber_id = request.user.id
-        author_id = kwargs.get('user_id')
-        author = get_object_or_404(User, id=author_id)
-        data = {'subscriber': subscriber_id, 'author': author_id}
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-
+        author = get_object_or_404(User, id=kwargs.get('user_id'))
+        if author.pk == request.user.pk:
+            return error_response('Вы не можете подписаться на себя')
+        if not subscribe(request.user, author.pk):
+            return error_response('Вы уже подписаны на автора')
+        author.followers_count += 1
+        author.is_subscribed = True
+
+        context = {'request': request,
+                   'recipes_limit': get_recipes_limit(request)}
         return Response(AuthorSubscriptionSerializer(
-            author, context={'request': request}).data,
+            author, context=context).data,
             status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
         author_id = kwargs.get('user_id')
-        subscriber_id = request.user.id
-        get_object_or_404(User, id=author_id)
-        subscription = Subscription.objects.filter(
-            subscriber__id=subscriber_id, author__id=author_id)
-        if subscription.exists():
-            subscription.delete()
+        if unsubscribe(request.user, author_id):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=author_id)
         return Response({'message': 'Такой подписки не существует'},
                         status=status.HTTP_400_BAD_REQUEST)
 
@@ -82,15 +156,28 @@ class SubscriptionViewSet(CreateDeleteViewSet):
 class SubscriptionsViewSet(mixins.ListModelMixin,
                            viewsets.GenericViewSet):
     serializer_class = AuthorSubscriptionSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = SubscriptionsPagination
     permission_classes = [permissions.IsAuthenticated, ]
 
     def get_queryset(self):
-        qs = Subscription.objects.filter(subscriber=self.request.user)
-        return User.objects.filter(subscription_author__in=qs)
-
-
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+        recipes = Recipe.objects.latest_per_author(
+            get_recipes_limit(self.request))
+        return User.objects.filter(
+            subscription_author__subscriber=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        ).order_by('pk')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = get_recipes_limit(self.request)
+        return context
+
+
+class TagViewSet(CachedReferenceMixin, viewsets.ReadOnlyModelViewSet):
+    reference_name = TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
@@ -104,46 +191,37 @@ class FavoriteViewSet(CreateDeleteViewSet):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def create(self, request, *args, **kwargs):
-        user = request.user
-        recipe_id = self.kwargs.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        data = {'user': user.id, 'recipe': recipe_id}
-        serializer = self.get_serializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(RecipesForActionsSerializer(
-            recipe, context={'request': request}).data,
-            status=status.HTTP_200_OK)
+        return add_recipe_response(
+            Favorite, request, self.kwargs.get('recipe_id'),
+            'Рецепт уже добавлен в список избранных')
 
     def destroy(self, request, *args, **kwargs):
-        user = request.user
-        recipe_id = self.kwargs.get('recipe_id')
-        get_object_or_404(Recipe, id=recipe_id)
-        favorite = Favorite.objects.filter(
-            user__id=user.id, recipe__id=recipe_id)
-        if favorite.exists():
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'message': 'Такой подписки не существует'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        return remove_recipe_response(
+            Favorite, request, self.kwargs.get('recipe_id'),
+            'Такой подписки не существует')
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedReferenceMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    reference_name = INGREDIENTS
+    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [permissions.AllowAny, ]
 
-    def get_queryset(self):
-        ingredients = Ingredient.objects
-        name = self.request.query_params.get('name')
-        if name:
-            ingredients = ingredients.filter(name__istartswith=name)
-        return ingredients.all()
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.search, request, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        content = ingredient_index.search(
+            request.query_params.get('name', ''),
+            settings.INGREDIENT_SEARCH_LIMIT)
+        return HttpResponse(content, content_type='application/json')
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [ReadAndOwner, ]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = RecipePagination
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
@@ -153,6 +231,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми; листается
+        курсором ?cursor=.
+        """
+        page = self.paginate_queryset(
+            Recipe.objects.feed(request.user).with_related_data())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def get_queryset(self):
         tags = self.request.query_params.getlist('tags')
         user = self.request.user
@@ -161,65 +251,116 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if author:
             queryset = queryset.filter(author=author)
         if tags:
-            queryset = queryset.filter_by_tags(tags)
-
-        queryset = queryset.add_user_annotations(user.pk)
-        if self.request.query_params.get('is_favorited'):
-            queryset = queryset.filter(is_favorited=True)
-        if self.request.query_params.get('is_in_shopping_cart'):
-            queryset = queryset.filter(is_in_shopping_cart=True)
-        return queryset
+            tags_mode = self.request.query_params.get('tags_mode')
+            queryset = queryset.filter_by_tags(
+                tags, match_all=tags_mode == 'all')
+
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = queryset.search(search)
+
+        is_favorited = self.request.query_params.get('is_favorited')
+        is_in_shopping_cart = self.request.query_params.get(
+            'is_in_shopping_cart')
+        if not user.is_authenticated:
+            if is_favorited or is_in_shopping_cart:
+                queryset = queryset.none()
+            return queryset.with_related_data()
+        if is_favorited:
+            queryset = queryset.filter(favorite__user=user)
+        if is_in_shopping_cart:
+            queryset = queryset.filter(shopping_carts__user=user)
+        return queryset.with_related_data()
 
 
 class ShoppingCartApiView(APIView):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def post(self, request, *args, **kwargs):
-        user = request.user
-        recipe_id = self.kwargs.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        data = {'user': user.id, 'recipe': recipe_id}
-        serializer = ShoppingCartSerializer(data=data)
+        return add_recipe_response(
+            ShoppingCart, request, self.kwargs.get('recipe_id'),
+            'Рецепт уже добавлен в список покупок')
+
+    def delete(self, request, *args, **kwargs):
+        return remove_recipe_response(
+            ShoppingCart, request, self.kwargs.get('recipe_id'),
+            'Такого рецепта нет в списке покупок')
+
+
+class RecipeBatchApiView(APIView):
+    """Пакетное добавление и удаление рецептов по списку id.
+    Возвращает результат для каждого переданного id.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    model = None
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(RecipesForActionsSerializer(
-            recipe, context={'request': request}).data,
-            status=status.HTTP_200_OK)
+        return serializer.validated_data['ids']
+
+    def post(self, request, *args, **kwargs):
+        results = add_recipes(
+            self.model, request.user, self.get_recipe_ids(request))
+        return self.results_response(results)
 
     def delete(self, request, *args, **kwargs):
-        user = request.user
-        recipe_id = self.kwargs.get('recipe_id')
-        get_object_or_404(Recipe, id=recipe_id)
-        recipe_in_shopping_cart = ShoppingCart.objects.filter(
-            recipe__id=recipe_id, user__id=user.id)
-        if recipe_in_shopping_cart.exists():
-            recipe_in_shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'message': 'Такого рецепта нет в списке покупок'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        results = remove_recipes(
+            self.model, request.user, self.get_recipe_ids(request))
+        return self.results_response(results)
+
+    def results_response(self, results):
+        return Response(
+            {'results': [{'id': pk, 'status': result}
+                         for pk, result in results.items()]},
+            status=status.HTTP_200_OK)
+
+
+class FavoriteBatchApiView(RecipeBatchApiView):
+    model = Favorite
 
 
-@api_view(['GET'])
-@permission_classes([permissions.IsAuthenticated])
-def download_shopping_cart(request):
-    query = IngredientRecipe.objects.select_related(
-        'recipe', 'ingredient'
-    )
-    query = query.filter(
-        recipe__shopping_carts__user=request.user
-    )
-    query = query.values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(
-        name=F('ingredient__name'),
-        unit=F('ingredient__measurement_unit'),
-        total=Sum('amount')
-    ).order_by('-total')
-
-    text = '\n'.join([f"{el['name']} ({el['unit']}) - {el['total']}"
-                      for el in query])
-    filename = 'shopping_cart.txt'
-    response = HttpResponse(text, content_type='text/plain')
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-
-    return response
+class ShoppingCartBatchApiView(RecipeBatchApiView):
+    model = ShoppingCart
+
+
+class DownloadShoppingCartApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
+    content_negotiation_class = IgnoreFormatContentNegotiation
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORTERS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(EXPORTERS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        exporter, content_type = EXPORTERS[export_format]
+
+        query = ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by('-total').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'total'
+        )
+        try:
+            content = exporter(query.iterator())
+        except ExportTimeout:
+            return Response(
+                {'message': 'Не удалось подготовить файл вовремя, '
+                            'повторите попытку позже или выберите '
+                            'другой формат'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        filename = f'shopping_cart.{export_format}'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+
+class MetricsApiView(APIView):
+    permission_classes = [permissions.IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        histograms, counters = registry.collect()
+        return HttpResponse(
+            render_prometheus(histograms) + render_counters(counters),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,10 @@
+def run_for_vendor(statements):
+    """Функция для RunPython, выполняющая SQL для текущей СУБД.
+    ``statements`` — словарь {vendor: последовательность запросов};
+    для СУБД, которых нет в словаре, ничего не выполняется.
+    """
+    def run(apps, schema_editor):
+        for statement in statements.get(
+                schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement, params=None)
+    return run
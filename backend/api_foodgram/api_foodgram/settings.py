@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +73,13 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT')
     }
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # The default in-memory test database fails writes from parallel
+    # threads with "table is locked" instead of waiting for the lock,
+    # and api.tests.test_concurrent_writes writes from several threads.
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'foodgram_test.sqlite3'),
+    }
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -78,6 +87,25 @@ DATABASES = {
 #     }
 # }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+# gunicorn reads the same variable
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', default=1))
+
+# Directory shared by the workers where each one publishes its request
+# metrics for /api/metrics/; required when WEB_CONCURRENCY > 1 and
+# should be emptied before the workers start.
+METRICS_DIR = os.getenv('METRICS_DIR', default='')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -117,20 +145,84 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static_backend')
 
 # Media
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.getenv(
+    'MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
 
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'api.authentication.CachedTokenAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.TimedJSONRenderer',
+        'api.renderers.TimedBrowsableAPIRenderer',
     ]
 }
 
+# Reference data (tags, ingredients) response cache
+REFERENCE_CACHE = os.getenv('REFERENCE_CACHE', default='default')
+REFERENCE_CACHE_MAX_AGE = 60
+# A process-local cache does not see version bumps made by other
+# processes (import_ingredients, other workers), so its entries must
+# expire on their own.
+REFERENCE_CACHE_TIMEOUT = (
+    REFERENCE_CACHE_MAX_AGE
+    if CACHES[REFERENCE_CACHE]['BACKEND'] in PROCESS_LOCAL_CACHES
+    else 24 * 60 * 60)
+
+# Resolved API tokens kept in process memory
+AUTH_TOKEN_CACHE_SIZE = 10000
+# Upper bound for a token to keep working after a change that sends no
+# signals, e.g. deactivating the user with QuerySet.update().
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Per-user favorites / shopping cart / subscriptions snapshot
+# Invalidated in the process that made the change; a process-local
+# cache only sees changes from other processes after the timeout.
+USER_RELATIONS_CACHE_TIMEOUT = (
+    30 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES
+    else 5 * 60)
+
+# Batch favorite / shopping cart requests
+RECIPE_BATCH_MAX_SIZE = 100
+
+# User list
+USERS_PAGE_SIZE = 10
+USERS_MAX_PAGE_SIZE = 100
+
+# Subscription feed: recipes of authors with more followers are not
+# pushed to timelines and are read from the recipes table instead
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_SIZE = 100
+FEED_PAGE_SIZE = 10
+FEED_MAX_PAGE_SIZE = 100
+
+# Ingredient autocomplete
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_TTL = 300
+
+# Recipe images
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (480, 360),
+    'detail': (1280, 960),
+}
+RECIPE_IMAGE_VARIANT_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_WORKERS = 2
+
+# Shopping cart export. PDFs are rendered in the request thread, so a
+# render holds a sync worker for up to SHOPPING_CART_PDF_TIMEOUT seconds.
+SHOPPING_CART_PDF_TIMEOUT = 10
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 DJOSER = {
     "LOGIN_FIELD": 'email',
     "SERIALIZERS": {'current_user': 'api.serializers.CustomUserSerializer',
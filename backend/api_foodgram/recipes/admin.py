@@ -2,30 +2,91 @@ from django.contrib import admin
 
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                      ShoppingCart, Tag)
+from .paginators import EstimatedCountPaginator
+from .shopping_list import track_recipe_ingredients
+
+
+class IngredientRecipeInline(admin.TabularInline):
+    model = IngredientRecipe
+    autocomplete_fields = ('ingredient',)
+    extra = 1
 
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'get_author', 'count_in_favorite')
-    list_filter = ('name', 'author__username', 'tags')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    inlines = (IngredientRecipeInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def count_in_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     def get_author(self, obj):
         return obj.author.username
 
+    def save_related(self, request, form, formsets, change):
+        with track_recipe_ingredients([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
     count_in_favorite.short_description = "in_favorite(count)"
+    count_in_favorite.admin_order_field = 'favorites_count'
     get_author.short_description = "author"
 
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    search_fields = ('name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class IngredientRecipeAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids += IngredientRecipe.objects.filter(
+                pk=obj.pk).values_list('recipe_id', flat=True)
+        with track_recipe_ingredients(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with track_recipe_ingredients([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with track_recipe_ingredients(
+                queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
+
+class UserRecipeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'color', 'slug')
+    search_fields = ('name', 'slug')
 
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
-admin.site.register(IngredientRecipe)
-admin.site.register(Tag)
+admin.site.register(Favorite, UserRecipeAdmin)
+admin.site.register(ShoppingCart, UserRecipeAdmin)
+admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
+admin.site.register(Tag, TagAdmin)
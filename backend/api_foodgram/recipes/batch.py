@@ -0,0 +1,185 @@
+from typing import Dict, Iterable
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import AutoField, Exists, F, OuterRef
+from django.db.models.sql import InsertQuery
+from users.models import Subscription
+
+from .feed import backfill, change_followers_count, prune
+from .models import Favorite, Recipe, ShoppingCart
+from .relations import invalidate_user_relations
+from .shopping_list import add_recipes_to_list, remove_recipes_from_list
+
+User = get_user_model()
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def _linked_recipes(model, user, recipe_ids):
+    """Одним запросом проверяет существование рецептов и их наличие
+    в списке пользователя. Возвращает {id рецепта: уже в списке}.
+    """
+    return dict(Recipe.objects.filter(pk__in=recipe_ids).annotate(
+        linked=Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')))
+    ).order_by().values_list('pk', 'linked'))
+
+
+def _change_counters(model, recipe_ids, delta):
+    field = COUNTER_FIELDS[model]
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def _lock_user(user):
+    """Блокирует строку пользователя до конца транзакции. Изменения
+    избранного и корзины, как и apply_deltas, берут эту блокировку
+    первой: запросы одного пользователя выполняются по очереди и не
+    ждут друг друга по кругу. SQLite и так выполняет записи по одной,
+    а чтение перед записью только мешает ему повысить блокировку.
+    """
+    if connections[router.db_for_write(User)].features.has_select_for_update:
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values('pk'))
+
+
+def insert_ignore(obj) -> bool:
+    """Вставляет строку одним INSERT ... ON CONFLICT DO NOTHING
+    (INSERT OR IGNORE в SQLite). Сигналы не отправляются.
+    Возвращает False, если такая строка уже есть.
+    """
+    model = type(obj)
+    using = router.db_for_write(model)
+    query = InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(
+        [field for field in model._meta.concrete_fields
+         if not isinstance(field, AutoField)],
+        [obj])
+    with connections[using].cursor() as cursor:
+        for sql, params in query.get_compiler(using).as_sql():
+            cursor.execute(sql, params)
+        return cursor.rowcount > 0
+
+
+def delete_rows(queryset) -> bool:
+    """Удаляет строки одним DELETE без сигналов. Возвращает False,
+    если удалять было нечего.
+    """
+    return queryset._raw_delete(queryset.db) > 0
+
+
+@transaction.atomic
+def add_recipe(model, user, recipe_id: int) -> bool:
+    """Добавляет рецепт в избранное или список покупок одним INSERT.
+    Счётчик и список покупок меняет только запрос, который вставил
+    строку, поэтому параллельные повторы их не задваивают.
+    """
+    _lock_user(user)
+    if not insert_ignore(model(user_id=user.pk, recipe_id=recipe_id)):
+        return False
+    _change_counters(model, [recipe_id], 1)
+    if model is ShoppingCart:
+        add_recipes_to_list(user.pk, [recipe_id])
+    transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return True
+
+
+@transaction.atomic
+def remove_recipe(model, user, recipe_id: int) -> bool:
+    """Удаляет рецепт из избранного или списка покупок одним DELETE."""
+    _lock_user(user)
+    if not delete_rows(model.objects.filter(user=user, recipe_id=recipe_id)):
+        return False
+    _change_counters(model, [recipe_id], -1)
+    if model is ShoppingCart:
+        remove_recipes_from_list(user.pk, [recipe_id])
+    transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return True
+
+
+@transaction.atomic
+def subscribe(user, author_id: int) -> bool:
+    """Подписывает пользователя на автора одним INSERT и добавляет
+    последние рецепты автора в его ленту.
+    """
+    if not insert_ignore(
+            Subscription(subscriber_id=user.pk, author_id=author_id)):
+        return False
+    change_followers_count(author_id, 1)
+    backfill(user.pk, author_id)
+    transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return True
+
+
+@transaction.atomic
+def unsubscribe(user, author_id: int) -> bool:
+    """Отменяет подписку одним DELETE и убирает рецепты автора
+    из ленты.
+    """
+    if not delete_rows(Subscription.objects.filter(
+            subscriber=user, author_id=author_id)):
+        return False
+    change_followers_count(author_id, -1)
+    prune(user.pk, author_id)
+    transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return True
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids: Iterable[int]) -> Dict[int, str]:
+    """Добавляет рецепты в избранное или список покупок пакетом:
+    проверка, INSERT и обновление счётчиков выполняются фиксированным
+    числом запросов. Строка пользователя блокируется, чтобы
+    параллельные запросы одного пользователя не задвоили счётчики.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    _lock_user(user)
+    linked = _linked_recipes(model, user, recipe_ids)
+    new_ids = [pk for pk, exists in linked.items() if not exists]
+    if new_ids:
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in new_ids],
+            ignore_conflicts=True)
+        _change_counters(model, new_ids, 1)
+        if model is ShoppingCart:
+            add_recipes_to_list(user.pk, new_ids)
+        transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return {
+        pk: NOT_FOUND if pk not in linked
+        else EXISTS if linked[pk] else ADDED
+        for pk in recipe_ids}
+
+
+@transaction.atomic
+def remove_recipes(model, user,
+                   recipe_ids: Iterable[int]) -> Dict[int, str]:
+    """Удаляет рецепты из избранного или списка покупок одним DELETE
+    без загрузки удаляемых строк.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    _lock_user(user)
+    linked = _linked_recipes(model, user, recipe_ids)
+    linked_ids = [pk for pk, exists in linked.items() if exists]
+    if linked_ids:
+        delete_rows(
+            model.objects.filter(user=user, recipe_id__in=linked_ids))
+        _change_counters(model, linked_ids, -1)
+        if model is ShoppingCart:
+            remove_recipes_from_list(user.pk, linked_ids)
+        transaction.on_commit(lambda: invalidate_user_relations(user.pk))
+    return {
+        pk: NOT_FOUND if pk not in linked
+        else REMOVED if linked[pk] else ABSENT
+        for pk in recipe_ids}
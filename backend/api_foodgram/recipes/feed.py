@@ -0,0 +1,129 @@
+"""Ленты подписок.
+
+Новый рецепт раскладывается в ленты подписчиков автора одним
+INSERT ... SELECT (fan-out on write), при подписке в ленту добавляются
+последние рецепты автора, при отписке они удаляются. Автор, у которого
+подписчиков становится больше FEED_FANOUT_MAX_FOLLOWERS, получает
+feed_fanout=False: его рецепты больше не раскладываются, и
+RecipeQuerySet.feed добавляет их при чтении (fan-out on read). Флаг
+не возвращается сам, когда подписчиков снова становится меньше: ленты
+его подписчиков неполны, пока rebuild не соберёт их заново.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, Case, F, IntegerField, Value, When
+from users.models import Subscription
+
+from .models import FeedEntry, Recipe
+
+User = get_user_model()
+
+
+def _fanout_authors(queryset):
+    """Оставляет строки авторов, чьи рецепты раскладываются в ленты."""
+    return queryset.filter(author__feed_fanout=True)
+
+
+def insert_entries(pairs) -> int:
+    """Вставляет в ленты пары (id пользователя, id рецепта) из выборки
+    ``pairs`` одним INSERT ... SELECT, пропуская уже существующие.
+    Возвращает число вставленных строк.
+    """
+    using = router.db_for_write(FeedEntry)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    sql, params = pairs.query.get_compiler(using).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote(FeedEntry._meta.db_table)} '
+            f'({quote("user_id")}, {quote("recipe_id")}) {sql} '
+            f'{connection.ops.ignore_conflicts_suffix_sql(True)}',
+            params)
+        return cursor.rowcount
+
+
+def change_followers_count(author_id: int, delta: int):
+    """Меняет счётчик подписчиков автора одним UPDATE. Автор, у
+    которого подписчиков становится больше FEED_FANOUT_MAX_FOLLOWERS,
+    в том же запросе перестаёт раскладывать рецепты в ленты.
+    """
+    queryset = User.objects.filter(pk=author_id)
+    if delta < 0:
+        queryset.filter(followers_count__gte=-delta).update(
+            followers_count=F('followers_count') + delta)
+        return
+    queryset.update(
+        followers_count=F('followers_count') + delta,
+        feed_fanout=Case(
+            When(followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+                 - delta, then=Value(False)),
+            default=F('feed_fanout'), output_field=BooleanField()))
+
+
+def push_recipe(recipe) -> int:
+    """Добавляет рецепт в ленты подписчиков автора. Для автора
+    с feed_fanout=False ничего не делает. Возвращает число строк.
+    """
+    return insert_entries(_fanout_authors(
+        Subscription.objects.filter(author_id=recipe.author_id)
+    ).annotate(
+        recipe_id=Value(recipe.pk, output_field=IntegerField())
+    ).order_by().values_list('subscriber_id', 'recipe_id'))
+
+
+def backfill(user_id: int, author_id: int):
+    """Добавляет в ленту последние FEED_BACKFILL_SIZE рецептов автора."""
+    recipe_ids = _fanout_authors(
+        Recipe.objects.filter(author_id=author_id)
+    ).order_by('-pk').values_list('pk', flat=True)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=pk)
+         for pk in recipe_ids[:settings.FEED_BACKFILL_SIZE]],
+        ignore_conflicts=True)
+
+
+def prune(user_id: int, author_id: int):
+    """Убирает из ленты рецепты автора."""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def reset_fanout(author_ids=None):
+    """Заново решает по счётчику подписчиков, чьи рецепты
+    раскладываются в ленты: всех авторов или переданных (список id или
+    выборка). После этого ленты их подписчиков нужно пересобрать.
+    """
+    authors = User.objects.all()
+    if author_ids is not None:
+        authors = authors.filter(pk__in=author_ids)
+    authors.update(feed_fanout=Case(
+        When(followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+             then=Value(True)),
+        default=Value(False), output_field=BooleanField()))
+
+
+@transaction.atomic
+def rebuild(user_ids=None) -> int:
+    """Пересобирает ленты из подписок в одной транзакции, целиком или
+    для переданных пользователей (список id или выборка): в каждую
+    попадают последние FEED_BACKFILL_SIZE рецептов каждого автора.
+    Полная пересборка заново решает, чьи рецепты раскладываются.
+    Возвращает число записанных строк.
+    """
+    entries = FeedEntry.objects.all()
+    # Подписки соединяются с уже отобранными рецептами: так
+    # коррелированный подзапрос latest_per_author выполняется по разу
+    # на рецепт, а не на каждую пару подписчик–рецепт.
+    pairs = _fanout_authors(Subscription.objects.filter(
+        author__recipes__in=Recipe.objects.latest_per_author(
+            settings.FEED_BACKFILL_SIZE)))
+    if user_ids is None:
+        reset_fanout()
+    else:
+        entries = entries.filter(user_id__in=user_ids)
+        pairs = pairs.filter(subscriber_id__in=user_ids)
+    entries.delete()
+    return insert_entries(pairs.order_by().values_list(
+        'subscriber_id', 'author__recipes'))
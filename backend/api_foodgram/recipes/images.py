@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+VARIANT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_variants_executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-image-variants'
+)
+_variants_in_progress = set()
+_variants_lock = threading.Lock()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, сохраняющее файл под именем из SHA-256 его
+    содержимого. Повторная загрузка того же изображения не создаёт
+    копию, а возвращает имя уже сохранённого файла.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name),
+                              digest.hexdigest() + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def save_as(self, name, content):
+        """Сохраняет файл под заданным именем, без хеширования."""
+        if self.exists(name):
+            return name
+        return super().save(name, content)
+
+
+recipe_image_storage = ContentAddressedStorage()
+
+
+def variant_name(name: str, variant: str) -> str:
+    extension = VARIANT_EXTENSIONS[settings.RECIPE_IMAGE_VARIANT_FORMAT]
+    return f'{posixpath.splitext(name)[0]}.{variant}.{extension}'
+
+
+def variant_url(image, variant: str, ready: bool) -> str:
+    """Возвращает URL уменьшенной копии изображения или оригинала,
+    если копии ещё не готовы. Готовность (``ready``) берётся из
+    Recipe.image_variants, хранилище при этом не опрашивается.
+    """
+    if ready:
+        return image.storage.url(variant_name(image.name, variant))
+    return image.url
+
+
+def _generate_variants(storage, name):
+    image_format = settings.RECIPE_IMAGE_VARIANT_FORMAT
+    try:
+        with storage.open(name) as source:
+            original = Image.open(source)
+            original.load()
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA')
+        if image_format == 'JPEG' and original.mode == 'RGBA':
+            original = original.convert('RGB')
+        for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            target = variant_name(name, variant)
+            if storage.exists(target):
+                continue
+            resized = original.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, image_format,
+                         quality=settings.RECIPE_IMAGE_QUALITY)
+            storage.save_as(target, ContentFile(buffer.getvalue()))
+        apps.get_model('recipes', 'Recipe').objects.filter(
+            image=name).update(image_variants=name)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', name)
+    finally:
+        connection.close()
+        with _variants_lock:
+            _variants_in_progress.discard(name)
+
+
+def schedule_variants(image):
+    """Ставит создание уменьшенных копий в фоновый пул,
+    чтобы не задерживать ответ на запрос.
+    """
+    if not image:
+        return
+    with _variants_lock:
+        if image.name in _variants_in_progress:
+            return
+        _variants_in_progress.add(image.name)
+    _variants_executor.submit(_generate_variants, image.storage, image.name)
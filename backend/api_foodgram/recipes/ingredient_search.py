@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import Ingredient
+from .versions import INGREDIENTS, get_version
+
+
+def normalize(text: str) -> str:
+    """Приводит строку к виду для сравнения без учёта регистра.
+    Кириллическая «ё» считается равной «е».
+    """
+    return text.strip().casefold().replace('ё', 'е')
+
+
+def serialize(ingredient: Ingredient) -> str:
+    return json.dumps(
+        {'id': ingredient.id,
+         'name': ingredient.name,
+         'measurement_unit': ingredient.measurement_unit},
+        ensure_ascii=False, separators=(',', ':'))
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный список ключей (нормализованное название, id)
+    и заранее сериализованный JSON каждого ингредиента. Поиск по
+    префиксу выполняется бинарным поиском. Индекс строится при первом
+    обращении и обновляется сигналами модели. Изменения из других
+    процессов подхватываются по версии справочника в общем кэше, а
+    при кэше, локальном для процесса, — по истечении ``ttl`` секунд.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._built_at = 0.0
+
+    def _get_state(self):
+        state = self._state
+        version = get_version(INGREDIENTS)
+        if (state is None or version != self._version
+                or time.monotonic() - self._built_at > self.ttl):
+            with self._lock:
+                if self._state is state:
+                    self._rebuild(version)
+                state = self._state
+        return state
+
+    def _rebuild(self, version):
+        items = {}
+        for ingredient in Ingredient.objects.order_by('pk').iterator():
+            items[ingredient.pk] = (normalize(ingredient.name),
+                                    serialize(ingredient))
+        keys = sorted((key, pk) for pk, (key, _) in items.items())
+        self._state = (keys, items)
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def update(self, ingredient: Ingredient, version: int):
+        """Применяет изменение, если индекс отстаёт ровно на эту
+        версию; иначе сбрасывает индекс до следующего обращения.
+        """
+        with self._lock:
+            if self._state is None:
+                return
+            if self._version != version - 1:
+                self._state = None
+                return
+            keys, items = self._state
+            keys, items = list(keys), dict(items)
+            if ingredient.pk in items:
+                del keys[bisect_left(keys, (items[ingredient.pk][0],
+                                            ingredient.pk))]
+            key = normalize(ingredient.name)
+            items[ingredient.pk] = (key, serialize(ingredient))
+            insort(keys, (key, ingredient.pk))
+            self._state = (keys, items)
+            self._version = version
+
+    def remove(self, pk: int, version: int):
+        with self._lock:
+            if self._state is None:
+                return
+            if self._version != version - 1 or pk not in self._state[1]:
+                self._state = None
+                return
+            keys, items = self._state
+            keys, items = list(keys), dict(items)
+            key, _ = items.pop(pk)
+            del keys[bisect_left(keys, (key, pk))]
+            self._state = (keys, items)
+            self._version = version
+
+    def search(self, query: str, limit: int) -> str:
+        """Возвращает JSON-массив ингредиентов: сначала точные
+        совпадения, затем совпадения по префиксу, затем по подстроке.
+        Пустой запрос возвращает весь справочник.
+        """
+        keys, items = self._get_state()
+        query = normalize(query)
+        if not query:
+            found = items
+        else:
+            found = []
+            position = bisect_left(keys, (query,))
+            while (position < len(keys) and len(found) < limit
+                   and keys[position][0].startswith(query)):
+                found.append(keys[position][1])
+                position += 1
+            if len(found) < limit:
+                for key, pk in keys:
+                    if query in key and not key.startswith(query):
+                        found.append(pk)
+                        if len(found) == limit:
+                            break
+        return '[' + ','.join(items[pk][1] for pk in found) + ']'
+
+
+ingredient_index = IngredientIndex(
+    ttl=getattr(settings, 'INGREDIENT_INDEX_TTL', 300))
@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe, Tag
+
+PAGE_SIZE = 10
+
+
+def join_distinct(slugs):
+    """Прежняя реализация фильтра: JOIN по тегам и DISTINCT."""
+    return Recipe.objects.filter(tags__slug__in=slugs).distinct()
+
+
+def semi_join_any(slugs):
+    return Recipe.objects.filter_by_tags(slugs)
+
+
+def semi_join_all(slugs):
+    return Recipe.objects.filter_by_tags(slugs, match_all=True)
+
+
+VARIANTS = (
+    ('join_distinct', join_distinct),
+    ('semi_join_any', semi_join_any),
+    ('semi_join_all', semi_join_all),
+)
+
+
+def median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = ('compare query plans and latency of recipe tag filters '
+            'on the current database')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tags', nargs='+',
+            help='slug тегов; по умолчанию три первых тега')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='число повторов каждого запроса')
+        parser.add_argument(
+            '--no-explain', action='store_false', dest='explain',
+            help='не печатать планы запросов')
+
+    def handle(self, *args, **options):
+        slugs = options['tags'] or list(
+            Tag.objects.order_by('pk').values_list('slug', flat=True)[:3])
+        if not slugs:
+            raise CommandError('В базе нет тегов')
+        repeat = options['repeat']
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, '
+            f'тегов: {Tag.objects.count()}, фильтр: {", ".join(slugs)}')
+
+        for name, variant in VARIANTS:
+            queryset = variant(slugs)
+            page = queryset.order_by('-pub_date', '-pk')
+            if options['explain']:
+                self.stdout.write(f'\n{name}: план первой страницы')
+                self.stdout.write(page[:PAGE_SIZE].explain())
+            total = queryset.count()
+            count_ms = median_ms(queryset.count, repeat)
+            page_ms = median_ms(lambda: list(page[:PAGE_SIZE]), repeat)
+            self.stdout.write(
+                f'{name}: найдено {total}, COUNT {count_ms:.2f} мс, '
+                f'первая страница {page_ms:.2f} мс')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.shopping_list import actual_totals, rebuild, stored_totals
+
+
+class Command(BaseCommand):
+    help = 'compare aggregated shopping lists with shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз')
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='пересобрать списки расходящихся пользователей')
+
+    def handle(self, *args, **options):
+        actual = actual_totals(options['users'])
+        stored = stored_totals(options['users'])
+        drifted = {
+            key for key in actual.keys() | stored.keys()
+            if actual.get(key) != stored.get(key)}
+        for user_id, ingredient_id in sorted(drifted):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидалось {actual.get((user_id, ingredient_id), 0)}, '
+                f'сохранено {stored.get((user_id, ingredient_id), 0)}')
+        if not drifted:
+            self.stdout.write('Списки покупок согласованы')
+            return
+        users = sorted({user_id for user_id, _ in drifted})
+        if not options['fix']:
+            raise CommandError(
+                f'Расхождения у пользователей: {len(users)}')
+        rebuild(users)
+        self.stdout.write(f'Пересобраны списки пользователей: {len(users)}')
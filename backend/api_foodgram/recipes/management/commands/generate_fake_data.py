@@ -0,0 +1,353 @@
+import random
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+from recipes.feed import rebuild as rebuild_feeds
+from recipes.feed import reset_fanout
+from recipes.images import recipe_image_storage, schedule_variants
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import rebuild as rebuild_shopping_lists
+from recipes.versions import TAGS, bump_version
+from users.models import Subscription
+
+User = get_user_model()
+
+FIRST_NAMES = (
+    'Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Светлана',
+    'Александр', 'Дмитрий', 'Сергей', 'Андрей', 'Алексей', 'Иван',
+    'Михаил', 'Никита', 'Павел',
+)
+LAST_NAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+    'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков',
+)
+DISHES = (
+    'суп', 'салат', 'каша', 'пирог', 'котлеты', 'рагу', 'блины', 'паста',
+    'омлет', 'плов', 'запеканка', 'борщ', 'гуляш', 'сырники', 'оладьи',
+    'жаркое', 'пицца', 'шарлотка', 'голубцы', 'уха',
+)
+STYLES = (
+    'домашний', 'по-деревенски', 'с грибами', 'с курицей', 'с сыром',
+    'овощной', 'быстрый', 'праздничный', 'постный', 'по-бабушкиному',
+    'с зеленью', 'острый',
+)
+TEXT_WORDS = (
+    'нарежьте', 'смешайте', 'добавьте', 'посолите', 'обжарьте', 'варите',
+    'запекайте', 'подавайте', 'минут', 'на', 'среднем', 'огне', 'до',
+    'готовности', 'мелко', 'крупно', 'масло', 'соль', 'перец', 'тесто',
+    'овощи', 'сковороде', 'духовке', 'горячим', 'вкуса', 'и', 'в', 'с',
+)
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#D25B87', 'dessert'),
+    ('Выпечка', '#C89B3C', 'bakery'),
+)
+IMAGE_SIZE = (600, 400)
+PUBLISHED_WITHIN = timedelta(days=365)
+
+
+class ZipfSampler:
+    """Выбирает элементы с вероятностью, обратно пропорциональной рангу
+    в степени ``exponent``: немногие популярные элементы встречаются
+    часто, длинный хвост — редко. Ранги перемешиваются, чтобы
+    популярность не совпадала с порядком id.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def distinct(self, k):
+        """Не более ``k`` различных элементов."""
+        return set(self.rng.choices(
+            self.items, cum_weights=self.cum_weights, k=k))
+
+
+class RowWriter:
+    """Пишет строки в таблицу модели пакетами: на PostgreSQL через
+    COPY FROM STDIN, на остальных базах одним executemany на пакет.
+    Столбцы, которых нет в строках, заполняются значениями по
+    умолчанию полей модели.
+    """
+
+    def __init__(self, stdout, batch_size):
+        self.stdout = stdout
+        self.batch_size = batch_size
+        self.copy = connection.vendor == 'postgresql'
+
+    def write(self, model, fields, rows) -> int:
+        opts = model._meta
+        given = [opts.get_field(name) for name in fields]
+        rest = [field for field in opts.concrete_fields
+                if not field.primary_key and field not in given]
+        defaults = tuple(field.get_db_prep_save(field.get_default(),
+                                                connection)
+                         for field in rest)
+        columns = [field.column for field in given + rest]
+        rows = iter(rows)
+        started = time.monotonic()
+        written = 0
+        with connection.cursor() as cursor:
+            while True:
+                batch = [row + defaults
+                         for row in islice(rows, self.batch_size)]
+                if not batch:
+                    break
+                if self.copy:
+                    self._copy(cursor, opts.db_table, columns, batch)
+                else:
+                    self._insert(cursor, opts.db_table, columns, batch)
+                written += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{opts.db_table}: записано {written} строк, '
+                    f'{written / max(elapsed, 1e-6):.0f} строк/с')
+        return written
+
+    @staticmethod
+    def _insert(cursor, table, columns, batch):
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor.executemany(
+            f'INSERT INTO {quote(table)} '
+            f'({", ".join(map(quote, columns))}) VALUES ({placeholders})',
+            batch)
+
+    @staticmethod
+    def _copy(cursor, table, columns, batch):
+        buffer = StringIO()
+        for row in batch:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        cursor.copy_expert(
+            f'COPY {quote(table)} ({", ".join(map(quote, columns))}) '
+            f'FROM STDIN', buffer)
+
+
+def _copy_value(value):
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return r'\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _created_ids(model, last):
+    return list(model.objects.filter(pk__gt=last).order_by(
+        'pk').values_list('pk', flat=True))
+
+
+def _last_id(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+
+
+def _count(rng, mean, limit):
+    """Число связей пользователя: экспоненциальное распределение со
+    средним ``mean`` — большинство пользователей почти неактивны.
+    """
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)), limit)
+
+
+class Command(BaseCommand):
+    help = 'generate fake users, recipes and relations for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='количество пользователей')
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='количество рецептов')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=6,
+            help='среднее количество ингредиентов в рецепте')
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='среднее количество избранных рецептов у пользователя')
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='среднее количество рецептов в корзине пользователя')
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='среднее количество подписок пользователя')
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='показатель распределения Ципфа для популярности '
+                 'рецептов, авторов и ингредиентов')
+        parser.add_argument(
+            '--images', type=int, default=12,
+            help='количество изображений-заглушек')
+        parser.add_argument(
+            '--seed', type=int,
+            help='начальное значение генератора случайных чисел')
+        parser.add_argument(
+            '--password', default='password',
+            help='пароль всех созданных пользователей')
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='количество строк в одном INSERT или COPY')
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        rng = random.Random(seed)
+        prefix = f'fake{seed}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Данные с seed={seed} уже созданы, укажите другой --seed')
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'В базе нет ингредиентов, сначала выполните '
+                'import_ingredients')
+
+        started = time.monotonic()
+        writer = RowWriter(self.stdout, options['batch_size'])
+        with transaction.atomic():
+            tag_ids = self.tags()
+            images = self.images(rng, options['images'])
+            user_ids = self.users(writer, rng, prefix, options)
+            # Авторы популярных рецептов чаще других получают подписчиков.
+            authors = ZipfSampler(user_ids, options['zipf'], rng)
+            recipe_ids = self.recipes(writer, rng, authors, images, options)
+            self.recipe_relations(writer, rng, recipe_ids, tag_ids,
+                                  ingredient_ids, options)
+            self.user_relations(writer, rng, user_ids, authors, recipe_ids,
+                                options)
+        call_command('recount', stdout=self.stdout)
+        # Корзины и подписки есть только у созданных пользователей,
+        # и подписаны они только друг на друга: остальные списки
+        # покупок и ленты не меняются.
+        created = User.objects.filter(username__startswith=prefix)
+        written = rebuild_shopping_lists(created)
+        self.stdout.write(f'Записано строк списков покупок: {written}')
+        reset_fanout(created)
+        self.stdout.write(f'Записано строк лент: {rebuild_feeds(created)}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с: пользователей {len(user_ids)}, '
+            f'рецептов {len(recipe_ids)}, seed={seed}'))
+
+    def tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS)
+            transaction.on_commit(lambda: bump_version(TAGS))
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def images(self, rng, count):
+        """Сохраняет одноцветные изображения-заглушки в MEDIA_ROOT и
+        ставит создание их уменьшенных копий в фоновый пул.
+        """
+        names = []
+        for _ in range(max(count, 1)):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            buffer = BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+            names.append(recipe_image_storage.save(
+                'recipes/images/placeholder.jpg',
+                ContentFile(buffer.getvalue())))
+        self.stdout.write(
+            f'Изображения сохранены в {recipe_image_storage.location}')
+        transaction.on_commit(lambda: [
+            schedule_variants(Recipe(image=name).image) for name in names])
+        return names
+
+    def users(self, writer, rng, prefix, options):
+        password = make_password(options['password'])
+        last = _last_id(User)
+        rows = (
+            (f'{prefix}{i}', f'{prefix}{i}@example.com',
+             rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), password)
+            for i in range(options['users']))
+        writer.write(User, ('username', 'email', 'first_name', 'last_name',
+                            'password'), rows)
+        return _created_ids(User, last)
+
+    def recipes(self, writer, rng, authors, images, options):
+        if not authors.items:
+            return []
+        now = timezone.now()
+        seconds = int(PUBLISHED_WITHIN.total_seconds())
+        adapt = connection.ops.adapt_datetimefield_value
+
+        def rows():
+            for _ in range(options['recipes']):
+                yield (
+                    authors.choice(),
+                    f'{rng.choice(DISHES).capitalize()} {rng.choice(STYLES)}',
+                    ' '.join(rng.choices(TEXT_WORDS, k=rng.randint(15, 60))),
+                    max(1, int(rng.lognormvariate(3.4, 0.6))),
+                    rng.choice(images),
+                    adapt(now - timedelta(seconds=rng.randrange(seconds))),
+                )
+
+        # Строки пишутся мимо ORM: bulk_create перезаписал бы pub_date
+        # текущим временем из-за auto_now.
+        last = _last_id(Recipe)
+        writer.write(Recipe, ('author', 'name', 'text', 'cooking_time',
+                              'image', 'pub_date'), rows())
+        return _created_ids(Recipe, last)
+
+    def recipe_relations(self, writer, rng, recipe_ids, tag_ids,
+                         ingredient_ids, options):
+        ingredients = ZipfSampler(ingredient_ids, options['zipf'], rng)
+        mean = max(options['ingredients_per_recipe'], 1)
+        writer.write(IngredientRecipe, ('recipe', 'ingredient', 'amount'), (
+            (recipe_id, ingredient_id, rng.choice((1, 2, 5, 10, 50, 100,
+                                                   200, 500)))
+            for recipe_id in recipe_ids
+            for ingredient_id in ingredients.distinct(
+                round(rng.triangular(1, 3 * mean - 1, mean)))))
+        writer.write(Recipe.tags.through, ('recipe', 'tag'), (
+            (recipe_id, tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(
+                1, min(3, len(tag_ids))))))
+
+    def user_relations(self, writer, rng, user_ids, authors, recipe_ids,
+                       options):
+        if not recipe_ids:
+            return
+        recipes = ZipfSampler(recipe_ids, options['zipf'], rng)
+        for model, mean in ((Favorite, options['favorites']),
+                            (ShoppingCart, options['carts'])):
+            writer.write(model, ('user', 'recipe'), (
+                (user_id, recipe_id)
+                for user_id in user_ids
+                for recipe_id in recipes.distinct(
+                    _count(rng, mean, len(recipe_ids)))))
+        writer.write(Subscription, ('subscriber', 'author'), (
+            (user_id, author_id)
+            for user_id in user_ids
+            for author_id in authors.distinct(
+                _count(rng, options['subscriptions'], len(user_ids)))
+            if author_id != user_id))
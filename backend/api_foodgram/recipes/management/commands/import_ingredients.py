@@ -1,21 +1,102 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, bump_version
+
+READ_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if row:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    """Построчно разбирает JSON-массив объектов вида
+    {"name": ..., "measurement_unit": ...}, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError('JSON-файл должен содержать массив')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    raise CommandError('Некорректный JSON-файл')
+                buffer += chunk
+                continue
+            yield item['name'], item['measurement_unit']
+            buffer = buffer[end:]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
     help = 'import ingredients from csv or json in db'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='/app/ingredients.csv',
+            help='путь к файлу csv или json')
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='формат файла, по умолчанию определяется по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='количество строк, читаемых из файла за один раз')
+
     def handle(self, *args, **options):
-        csv_file = '/app/ingredients.csv'
-        with open(csv_file, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(
-                f, fieldnames=['name', 'measurement_unit'])
-            count = 0
-            for row in reader:
-                Ingredient.objects.update_or_create(
-                    id=count, name=row['name'],
-                    measurement_unit=row['measurement_unit']
-                )
-                count += 1
+        path = options['path']
+        file_format = (options['file_format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неподдерживаемый формат: {file_format}')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        rows = READERS[file_format](path)
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        processed = 0
+        with transaction.atomic():
+            count_before = Ingredient.objects.count()
+            while True:
+                batch = [
+                    Ingredient(name=name.strip(),
+                               measurement_unit=unit.strip())
+                    for name, unit in islice(rows, batch_size)]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {processed} строк, '
+                    f'{processed / max(elapsed, 1e-6):.0f} строк/с')
+            created = Ingredient.objects.count() - count_before
+        bump_version(INGREDIENTS)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {processed} строк за {elapsed:.1f} с, '
+            f'добавлено {created}, уже были в базе {processed - created}'))
@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('load demo data from a fixture and rebuild counters, '
+            'shopping lists and feeds that loaddata does not maintain')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fixture', nargs='?', default='fixtures.json',
+            help='файл фикстуры, по умолчанию fixtures.json')
+
+    def handle(self, *args, **options):
+        # loaddata сохраняет объекты в обход сигналов и затирает
+        # счётчики значениями по умолчанию.
+        call_command('loaddata', options['fixture'])
+        call_command('recount')
+        call_command('rebuild_shopping_lists')
+        call_command('rebuild_feeds')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes.feed import rebuild
+
+
+class Command(BaseCommand):
+    help = 'rebuild subscription feeds from subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз')
+
+    def handle(self, *args, **options):
+        written = rebuild(options['users'])
+        self.stdout.write(f'Записано строк лент: {written}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = 'rebuild aggregated shopping lists from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз')
+
+    def handle(self, *args, **options):
+        written = rebuild(options['users'])
+        self.stdout.write(f'Записано строк списков покупок: {written}')
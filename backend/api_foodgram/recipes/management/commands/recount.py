@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'recount denormalized counters of recipes and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='количество записей, исправляемых одним запросом')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, field, related, related_field in COUNTERS:
+            actual = count_of(related, related_field)
+            drifted = model.objects.annotate(
+                actual=actual
+            ).filter(~Q(**{field: F('actual')})).order_by(
+                'pk').values_list('pk', flat=True)
+            fixed = last = 0
+            while True:
+                batch = list(drifted.filter(pk__gt=last)[:batch_size])
+                if not batch:
+                    break
+                last = batch[-1]
+                with transaction.atomic():
+                    fixed += model.objects.filter(
+                        pk__in=batch).update(**{field: actual})
+            self.stdout.write(
+                f'{model.__name__}.{field}: исправлено {fixed}')
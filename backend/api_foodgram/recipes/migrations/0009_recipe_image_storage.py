@@ -0,0 +1,19 @@
+# Generated by Django 2.2.19 on 2026-10-17 05:58
+
+from django.db import migrations, models
+import recipes.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.images.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 2.2.19 on 2026-10-17 06:04
+
+import django.contrib.postgres.search
+from api_foodgram.migration_utils import run_for_vendor
+from django.db import migrations
+
+POSTGRESQL_INSTALL = (
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+    """
+    CREATE INDEX recipes_recipe_search_vector_idx
+    ON recipes_recipe USING gin (search_vector)
+    """,
+)
+
+POSTGRESQL_UNINSTALL = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_idx',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+)
+
+# В FTS5 нет русского стемминга и свёртки «ё», поэтому «ё» заменяется
+# при индексации, а запрос ищет слова по префиксу (см. recipes.search).
+SQLITE_NORMALIZED = (
+    "replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(new.text, 'ё', 'е'), 'Ё', 'Е')"
+)
+
+# Триггеры вынесены отдельно: миграции, пересоздающие таблицу
+# recipes_recipe в SQLite, теряют их и устанавливают заново.
+SQLITE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, {SQLITE_NORMALIZED});
+    END
+    """,
+    f"""
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, {SQLITE_NORMALIZED});
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+    END
+    """,
+)
+
+SQLITE_INSTALL = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # Скрытый столбец rank возвращает bm25 с весами: название важнее
+    # описания (см. recipes.search).
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rank) "
+    "VALUES ('rank', 'bm25(10.0, 1.0)')",
+    *SQLITE_TRIGGERS,
+    f"""
+    INSERT INTO recipes_recipe_fts (rowid, name, text)
+    SELECT new.id, {SQLITE_NORMALIZED} FROM recipes_recipe AS new
+    """,
+)
+
+SQLITE_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_INSTALL,
+                            'sqlite': SQLITE_INSTALL}),
+            run_for_vendor({'postgresql': POSTGRESQL_UNINSTALL,
+                            'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.19 on 2026-10-17 06:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Значения настроек на момент создания миграции: результат миграции
+# не должен зависеть от конфигурации, с которой она применяется.
+FANOUT_MAX_FOLLOWERS = 10000
+BACKFILL_SIZE = 100
+
+
+def fill_feeds(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Subscription = apps.get_model('users', 'Subscription')
+    User.objects.filter(
+        followers_count__gt=FANOUT_MAX_FOLLOWERS
+    ).update(feed_fanout=False)
+    latest = Recipe.objects.filter(
+        author=OuterRef('author')
+    ).order_by('-pub_date', '-pk').values('pk')[:BACKFILL_SIZE]
+    # Подписки соединяются с уже отобранными рецептами: коррелированный
+    # подзапрос выполняется по разу на рецепт, а не на пару.
+    pairs = Subscription.objects.filter(
+        author__feed_fanout=True,
+        author__recipes__in=Recipe.objects.filter(pk__in=Subquery(latest)),
+    ).order_by().values_list('subscriber_id', 'author__recipes')
+    sql, params = pairs.query.sql_with_params()
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f'INSERT INTO {quote(FeedEntry._meta.db_table)} '
+        f'({quote("user_id")}, {quote("recipe_id")}) {sql}', params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_user_leading_indexes'),
+        ('users', '0007_user_feed_fanout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_user_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.19 on 2026-10-17 08:05
+
+from importlib import import_module
+
+from api_foodgram.migration_utils import run_for_vendor
+from django.conf import settings
+from django.db import migrations, models
+from recipes.images import variant_name
+
+# SQLite добавляет и удаляет столбец, пересоздавая таблицу, и теряет
+# триггеры полнотекстового поиска из 0012_recipe_search. Они создаются
+# заново после изменения таблицы в обе стороны.
+SQLITE_TRIGGERS = import_module(
+    'recipes.migrations.0012_recipe_search').SQLITE_TRIGGERS
+
+
+def mark_existing_variants(apps, schema_editor):
+    """Отмечает изображения, копии которых уже лежат в хранилище.
+    Имена копий зависят от настроек, с которыми копии создавались.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = Recipe.objects.exclude(image='').order_by().values_list(
+        'image', flat=True).distinct()
+    for name in names.iterator():
+        if all(storage.exists(variant_name(name, variant))
+               for variant in settings.RECIPE_IMAGE_VARIANTS):
+            Recipe.objects.filter(image=name).update(image_variants=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_feed_entry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            migrations.RunPython.noop,
+            run_for_vendor({'sqlite': SQLITE_TRIGGERS}),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='Копии созданы для изображения'),
+        ),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_TRIGGERS}),
+            migrations.RunPython.noop,
+        ),
+        migrations.RunPython(mark_existing_variants,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.19 on 2026-10-17 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='favorite',
+            name='unique_user_recipe',
+        ),
+        migrations.RemoveConstraint(
+            model_name='shoppingcart',
+            name='unique_user_recipe_shop',
+        ),
+        migrations.RemoveIndex(
+            model_name='favorite',
+            name='favorite_user_recipe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shoppingcart',
+            name='shopping_cart_user_recipe_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_recipe_shop'),
+        ),
+    ]
@@ -1,9 +1,14 @@
 from typing import List, Optional
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
+from users.models import Subscription
+
+from .images import recipe_image_storage
+from .search import search_recipes
 
 User = get_user_model()
 
@@ -19,6 +24,13 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit'
+            )
+        ]
+
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -52,23 +64,78 @@ class Tag(models.Model):
 
 
 class RecipeQuerySet(models.QuerySet):
-    def filter_by_tags(self, tags: List[str]):
-        if tags:
-            return self.filter(tags__slug__in=tags).distinct()
-        return self
-
-    def add_user_annotations(self, user_id: Optional[int]):
-        return self.annotate(
-            is_favorited=Exists(
-                Favorite.objects.filter(
-                    user__id=user_id, recipe__pk=OuterRef('pk'))
-            ),
-            is_in_shopping_cart=Exists(
-                ShoppingCart.objects.filter(
-                    user__id=user_id, recipe__pk=OuterRef('pk'))
+    def filter_by_tags(self, tags: List[str], match_all: bool = False):
+        """Оставляет рецепты с любым из тегов или, при ``match_all``,
+        со всеми тегами сразу. Отбор идёт полусоединением
+        ``id IN (SELECT recipe_id ...)`` по таблице связей, без JOIN
+        и DISTINCT по строкам рецептов, поэтому не мешает сортировке
+        и подсчёту.
+        """
+        if not tags:
+            return self
+        slugs = set(tags)
+        recipe_ids = Recipe.tags.through.objects.filter(
+            tag__slug__in=slugs).order_by().values('recipe_id')
+        if match_all:
+            recipe_ids = recipe_ids.annotate(
+                matched=Count('tag_id')).filter(matched=len(slugs))
+        return self.filter(pk__in=recipe_ids.values('recipe_id'))
+
+    def search(self, query: str):
+        """Полнотекстовый поиск по названию и описанию с сортировкой
+        по рангу совпадения.
+        """
+        return search_recipes(self, query)
+
+    def with_related_data(self):
+        """Подгружает автора, теги и ингредиенты фиксированным
+        числом запросов вне зависимости от количества рецептов.
+        """
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient')
             ),
         )
 
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь, с ключом
+        сортировки ``feed_id``. Обычно это выборка по его ленте
+        FeedEntry: ключ берётся из самой ленты, и страница читается
+        диапазоном индекса (user, recipe) без сортировки. Рецепты
+        авторов с feed_fanout=False (ставших популярными) в ленты не
+        раскладываются или разложены не полностью и добавляются
+        условием по автору при чтении, сколько бы подписчиков у них
+        ни было сейчас.
+        """
+        popular = list(Subscription.objects.filter(
+            subscriber=user, author__feed_fanout=False
+        ).values_list('author_id', flat=True))
+        if not popular:
+            return self.filter(feed_entries__user=user).annotate(
+                feed_id=F('feed_entries__recipe_id'))
+        return self.filter(
+            Q(pk__in=FeedEntry.objects.filter(
+                user=user).values('recipe_id'))
+            | Q(author_id__in=popular)
+        ).annotate(feed_id=F('pk'))
+
+    def latest_per_author(self, limit: Optional[int]):
+        """Оставляет не больше ``limit`` последних рецептов каждого
+        автора. Отбор выполняется коррелированным подзапросом по индексу
+        (author, pub_date), поэтому подходит для prefetch по списку авторов.
+        """
+        if limit is None:
+            return self
+        latest = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-pub_date', '-pk').values('pk')[:limit]
+        return self.filter(pk__in=Subquery(latest))
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -89,8 +156,19 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1)])
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=recipe_image_storage,
         verbose_name='Картинка'
     )
+    # Имя изображения, для которого фоновая задача создала уменьшенные
+    # копии. После замены изображения имена расходятся, и до появления
+    # новых копий отдаётся оригинал.
+    image_variants = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Копии созданы для изображения'
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='IngredientRecipe',
@@ -107,11 +185,32 @@ class Recipe(models.Model):
         auto_now=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    # Заполняется триггером; GIN-индекс (PostgreSQL) и таблицу FTS5
+    # (SQLite) создаёт миграция 0012_recipe_search.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -162,7 +261,7 @@ class Favorite(models.Model):
     class Meta:
         constraints = [
             models.UniqueConstraint(
-                fields=['recipe', 'user'],
+                fields=['user', 'recipe'],
                 name='unique_user_recipe'
             )
         ]
@@ -189,7 +288,7 @@ class ShoppingCart(models.Model):
     class Meta:
         constraints = [
             models.UniqueConstraint(
-                fields=['recipe', 'user'],
+                fields=['user', 'recipe'],
                 name='unique_user_recipe_shop'
             )
         ]
@@ -198,3 +297,63 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил в вписок покупок {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Сводная строка списка покупок: суммарное количество ингредиента
+    по всем рецептам из корзины пользователя. Поддерживается
+    инкрементально при изменении корзины и состава рецептов.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_user_ingredient'
+            )
+        ]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Сводный список покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.total}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика. Строки раскладываются при публикации
+    рецепта и при подписке; лента читается по порядку id рецептов.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_user_recipe'
+            )
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,29 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц в админке.
+
+    Для выборки без фильтров на PostgreSQL берёт оценку числа строк
+    из статистики планировщика (pg_class.reltuples) вместо COUNT(*),
+    который на миллионах строк читает всю таблицу. Для небольших таблиц
+    и отфильтрованных выборок выполняется обычный подсчёт.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return super().count
+        return int(row[0])
@@ -0,0 +1,51 @@
+from typing import FrozenSet, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from users.models import Subscription
+
+from .models import Favorite, ShoppingCart
+
+
+class UserRelations(NamedTuple):
+    """Снимок связей пользователя: id избранных рецептов, рецептов
+    в списке покупок и авторов, на которых он подписан.
+    """
+    favorites: FrozenSet[int] = frozenset()
+    shopping_cart: FrozenSet[int] = frozenset()
+    following: FrozenSet[int] = frozenset()
+
+
+EMPTY_RELATIONS = UserRelations()
+
+
+def _key(user_id: int) -> str:
+    return f'relations:{user_id}'
+
+
+def get_user_relations(user) -> UserRelations:
+    """Возвращает снимок связей из кэша или загружает его тремя
+    запросами. Для анонимного пользователя база не используется.
+    Снимок сбрасывается после фиксации изменений; кэш в памяти
+    процесса узнаёт об изменениях из других процессов только по
+    истечении USER_RELATIONS_CACHE_TIMEOUT.
+    """
+    if not user.is_authenticated:
+        return EMPTY_RELATIONS
+    relations = cache.get(_key(user.pk))
+    if relations is None:
+        relations = UserRelations(
+            favorites=frozenset(Favorite.objects.filter(
+                user=user).values_list('recipe_id', flat=True)),
+            shopping_cart=frozenset(ShoppingCart.objects.filter(
+                user=user).values_list('recipe_id', flat=True)),
+            following=frozenset(Subscription.objects.filter(
+                subscriber=user).values_list('author_id', flat=True)),
+        )
+        cache.set(_key(user.pk), relations,
+                  settings.USER_RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def invalidate_user_relations(user_id: int):
+    cache.delete(_key(user_id))
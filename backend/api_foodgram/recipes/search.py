@@ -0,0 +1,77 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_JOIN = f'{FTS_TABLE}.rowid = recipes_recipe.id'
+FTS_MATCH = f'{FTS_TABLE} MATCH %s'
+# Скрытый столбец rank таблицы FTS5 возвращает bm25 с весами,
+# заданными миграцией 0012 (название важнее описания). bm25 тем
+# меньше, чем лучше совпадение, поэтому знак меняется: ранг, как и в
+# PostgreSQL, убывает. Столбец, в отличие от прямого вызова bm25(),
+# допустим и в запросе с GROUP BY, который Django строит для COUNT.
+FTS_RANK = f'-{FTS_TABLE}.rank'
+
+
+class _FtsRank(RawSQL):
+    def __init__(self):
+        super().__init__(FTS_RANK, [], output_field=FloatField())
+
+    def get_group_by_cols(self, alias=None):
+        return []
+
+
+def _postgresql_search(queryset, query):
+    """Поиск по столбцу tsvector с GIN-индексом и русским стеммингом."""
+    search_query = SearchQuery(query, config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query))
+
+
+def _fts_match(query):
+    """Превращает строку пользователя в безопасный запрос FTS5:
+    каждое слово ищется как префикс, все слова должны встретиться.
+    Стемминга для русского в SQLite нет, префикс его заменяет.
+    """
+    words = re.findall(r'\w+', query.casefold().replace('ё', 'е'))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _sqlite_search(queryset, query):
+    """Поиск по виртуальной таблице FTS5 с ранжированием bm25.
+    Таблица присоединяется к рецептам, поэтому MATCH и bm25
+    вычисляются за один проход по индексу, а не для каждой строки.
+    """
+    match = _fts_match(query)
+    if not match:
+        return queryset.none()
+    return queryset.extra(
+        tables=[FTS_TABLE], where=[FTS_JOIN, FTS_MATCH], params=[match]
+    ).annotate(rank=_FtsRank())
+
+
+def _fallback_search(queryset, query):
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+    ).annotate(rank=Value(1.0, output_field=FloatField()))
+
+
+BACKENDS = {
+    'postgresql': _postgresql_search,
+    'sqlite': _sqlite_search,
+}
+
+
+def search_recipes(queryset, query: str):
+    """Оставляет рецепты, подходящие под поисковую строку, и
+    сортирует их по убыванию ранга. Бэкенд выбирается по базе данных
+    запроса; индексы и триггеры создаёт миграция 0012.
+    """
+    vendor = connections[queryset.db].vendor
+    search = BACKENDS.get(vendor, _fallback_search)
+    return search(queryset, query).order_by('-rank', '-pk')
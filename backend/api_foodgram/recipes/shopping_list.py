@@ -0,0 +1,130 @@
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Mapping
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+
+def recipes_amounts(recipe_ids: Iterable[int]) -> Dict[int, int]:
+    """Суммарное количество каждого ингредиента в переданных рецептах."""
+    return dict(IngredientRecipe.objects.filter(
+        recipe_id__in=list(recipe_ids)
+    ).order_by().values('ingredient_id').annotate(
+        total=Sum('amount')
+    ).values_list('ingredient_id', 'total'))
+
+
+def apply_deltas(user_ids: Iterable[int], deltas: Mapping[int, int]):
+    """Прибавляет изменения количества ингредиентов к спискам покупок
+    пользователей. Число запросов не зависит от числа ингредиентов:
+    один UPDATE существующих строк, один INSERT недостающих и один
+    DELETE обнулившихся. Вызывается внутри транзакции изменения корзины;
+    строки пользователей блокируются, чтобы параллельные изменения
+    не потеряли вставку одной и той же строки списка.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = list(User.objects.select_for_update().filter(
+        pk__in=list(user_ids)).order_by('pk').values_list('pk', flat=True))
+    if not user_ids:
+        return
+    rows = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=list(deltas))
+    rows.update(total=Greatest(F('total') + Case(
+        *[When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField()
+    ), 0))
+    existing = set(rows.values_list('user_id', 'ingredient_id'))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=pk, total=delta)
+        for user_id in user_ids
+        for pk, delta in deltas.items()
+        if delta > 0 and (user_id, pk) not in existing
+    ], ignore_conflicts=True)
+    rows.filter(total=0).delete()
+
+
+def add_recipes_to_list(user_id: int, recipe_ids: Iterable[int]):
+    apply_deltas([user_id], recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_list(user_id: int, recipe_ids: Iterable[int]):
+    apply_deltas([user_id], {
+        pk: -total for pk, total in recipes_amounts(recipe_ids).items()})
+
+
+def change_recipe_ingredients(recipe_id: int, old: Mapping[int, int],
+                              new: Mapping[int, int]):
+    """Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых рецепт лежит в корзине.
+    """
+    deltas = Counter(new)
+    deltas.subtract(old)
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    apply_deltas(user_ids, deltas)
+
+
+@contextmanager
+def track_recipe_ingredients(recipe_ids: Iterable[int]):
+    """Переносит в списки покупок изменения состава рецептов,
+    сделанные внутри блока в обход сериализатора, например в админке.
+    """
+    with transaction.atomic():
+        before = {pk: recipes_amounts([pk]) for pk in set(recipe_ids)}
+        yield
+        for pk, old in before.items():
+            change_recipe_ingredients(pk, old, recipes_amounts([pk]))
+
+
+def actual_totals(user_ids=None):
+    """Считает списки покупок заново по корзинам:
+    {(id пользователя, id ингредиента): количество}.
+    """
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in carts.order_by().values(
+            'user_id', 'recipe__recipes__ingredient_id'
+        ).annotate(
+            total=Sum('recipe__recipes__amount')
+        ).filter(total__gt=0).values_list(
+            'user_id', 'recipe__recipes__ingredient_id', 'total')
+    }
+
+
+def stored_totals(user_ids=None):
+    rows = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.values_list(
+            'user_id', 'ingredient_id', 'total')
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids=None) -> int:
+    """Пересобирает списки покупок из корзин, целиком или для
+    переданных пользователей. Возвращает число записанных строк.
+    """
+    rows = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows.delete()
+    items = ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=pk, total=total)
+        for (user_id, pk), total in actual_totals(user_ids).items())
+    return len(items)
@@ -0,0 +1,152 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import Subscription
+
+from .feed import backfill, change_followers_count, prune, push_recipe
+from .images import schedule_variants
+from .ingredient_search import ingredient_index
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .relations import invalidate_user_relations
+from .shopping_list import add_recipes_to_list, remove_recipes_from_list
+from .versions import INGREDIENTS, TAGS, bump_version
+
+User = get_user_model()
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик в рамках текущей транзакции,
+    не опуская его ниже нуля.
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_index(sender, instance, raw=False, **kwargs):
+    def on_commit():
+        version = bump_version(INGREDIENTS)
+        if raw:
+            ingredient_index.invalidate()
+        else:
+            ingredient_index.update(instance, version)
+
+    transaction.on_commit(on_commit)
+
+
+@receiver(post_delete, sender=Ingredient)
+def remove_from_ingredient_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(
+        lambda: ingredient_index.remove(pk, bump_version(INGREDIENTS)))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_recipe_relations(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_relations(user_id))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_relations(sender, instance, **kwargs):
+    subscriber_id = instance.subscriber_id
+    transaction.on_commit(
+        lambda: invalidate_user_relations(subscriber_id))
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image_variants != instance.image.name:
+        image = instance.image
+        transaction.on_commit(lambda: schedule_variants(image))
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, raw=False,
+                              **kwargs):
+    if created and not raw:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def increment_in_carts_count(sender, instance, created, raw=False,
+                             **kwargs):
+    if created and not raw:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_in_carts_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_recipes_to_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты
+    # ещё не удалены и их можно вычесть из списка покупок.
+    remove_recipes_from_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(sender, instance, created, raw=False,
+                              **kwargs):
+    if created and not raw:
+        change_followers_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers_count(sender, instance, **kwargs):
+    change_followers_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def push_to_feeds(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        push_recipe(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill(instance.subscriber_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_feed(sender, instance, **kwargs):
+    prune(instance.subscriber_id, instance.author_id)
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+AUTH_TOKENS = 'auth_tokens'
+
+
+def _cache():
+    return caches[settings.REFERENCE_CACHE]
+
+
+def _key(name: str) -> str:
+    return f'reference:version:{name}'
+
+
+def get_version(name: str, timeout=None) -> int:
+    """Возвращает текущую версию справочника.
+    Начальное значение берётся из времени, чтобы после вытеснения
+    или истечения ключа версия не совпала ни с одной из прежних.
+    """
+    cache = _cache()
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), int(time.time() * 1000), timeout=timeout)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump_version(name: str, timeout=None) -> int:
+    """Увеличивает версию справочника после его изменения."""
+    cache = _cache()
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        return get_version(name, timeout)
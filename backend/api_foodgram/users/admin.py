@@ -1,12 +1,25 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from recipes.paginators import EstimatedCountPaginator
 
 from .models import Subscription, User
 
 
 class UserAdmin(BaseUserAdmin):
-    list_filter = ('email', 'username')
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('email', 'username')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('subscriber', 'author')
+    list_select_related = ('subscriber', 'author')
+    search_fields = ('subscriber__username', 'author__username')
+    autocomplete_fields = ('subscriber', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
-admin.site.register(Subscription)
+admin.site.register(Subscription, SubscriptionAdmin)
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.19 on 2026-10-17 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['subscriber', 'author'], name='subscription_subscriber_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from api_foodgram.migration_utils import run_for_vendor
+from django.db import migrations
+
+# Индексы под поиск пользователей по началу имени или email без учёта
+# регистра (istartswith). PostgreSQL сравнивает UPPER(поле::text) через
+# LIKE, для него нужен индекс по тому же выражению с text_pattern_ops.
+# В SQLite LIKE не учитывает регистр и использует индекс с NOCASE.
+POSTGRESQL_INSTALL = (
+    'CREATE INDEX users_user_username_upper_like '
+    'ON users_user (UPPER(username::text) text_pattern_ops)',
+    'CREATE INDEX users_user_email_upper_like '
+    'ON users_user (UPPER(email::text) text_pattern_ops)',
+)
+
+SQLITE_INSTALL = (
+    'CREATE INDEX users_user_username_nocase '
+    'ON users_user (username COLLATE NOCASE)',
+    'CREATE INDEX users_user_email_nocase '
+    'ON users_user (email COLLATE NOCASE)',
+)
+
+POSTGRESQL_UNINSTALL = (
+    'DROP INDEX IF EXISTS users_user_username_upper_like',
+    'DROP INDEX IF EXISTS users_user_email_upper_like',
+)
+
+SQLITE_UNINSTALL = (
+    'DROP INDEX IF EXISTS users_user_username_nocase',
+    'DROP INDEX IF EXISTS users_user_email_nocase',
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_leading_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_INSTALL,
+                            'sqlite': SQLITE_INSTALL}),
+            run_for_vendor({'postgresql': POSTGRESQL_UNINSTALL,
+                            'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.19 on 2026-10-17 07:20
+
+from api_foodgram.migration_utils import run_for_vendor
+from django.db import migrations, models
+
+# SQLite добавляет и удаляет столбец, пересоздавая таблицу, и теряет
+# индексы, созданные в 0006_user_search_indexes вне схемы модели.
+# Они создаются заново после изменения таблицы в обе стороны.
+SQLITE_REINSTALL = (
+    'CREATE INDEX IF NOT EXISTS users_user_username_nocase '
+    'ON users_user (username COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS users_user_email_nocase '
+    'ON users_user (email COLLATE NOCASE)',
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            migrations.RunPython.noop,
+            run_for_vendor({'sqlite': SQLITE_REINSTALL}),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='feed_fanout',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Рецепты раскладываются в ленты'),
+        ),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_REINSTALL}),
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -21,6 +21,21 @@ class User(AbstractUser):
         blank=False,
         max_length=16
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
+    feed_fanout = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Рецепты раскладываются в ленты'
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['id', 'username', 'first_name', 'last_name']
 
@@ -48,6 +63,10 @@ class Subscription(models.Model):
                 name='unique_author_subscriber'
             )
         ]
+        indexes = [
+            models.Index(fields=['subscriber', 'author'],
+                         name='subscription_subscriber_idx'),
+        ]
 
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'